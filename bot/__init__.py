@@ -1,5 +1,6 @@
 from telethon import TelegramClient
 from logging import getLogger
+import asyncio
 from logging.config import dictConfig
 from .config import Telegram, LOGGER_CONFIG_JSON
 
@@ -12,6 +13,15 @@ apply_sensitive_data_filter()
 version = 1.6
 logger = getLogger('bot')
 
+# The web server and Telegram client share the loop created below, so the
+# policy has to be swapped before TelegramClient grabs it
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.info('Using uvloop event loop')
+except ImportError:
+    pass
+
 TelegramBot = TelegramClient(
     session='bot',
     api_id=Telegram.API_ID,
@@ -33,9 +33,12 @@ clean_url = urlunparse((
     parsed_url.fragment
 ))
 
-DB_POOL_SIZE = int(environ.get("DB_POOL_SIZE") or "10")
-DB_MAX_OVERFLOW = int(environ.get("DB_MAX_OVERFLOW") or "20")
+# Admin pages fan their queries out over several sessions at once, so size for concurrent requests x 3-4
+DB_POOL_SIZE = int(environ.get("DB_POOL_SIZE") or "20")
+DB_MAX_OVERFLOW = int(environ.get("DB_MAX_OVERFLOW") or "40")
 DB_POOL_RECYCLE = int(environ.get("DB_POOL_RECYCLE") or "300")
+# Per-connection cache of server-side prepared statements (SQLAlchemy asyncpg adapter)
+DB_STATEMENT_CACHE_SIZE = int(environ.get("DB_STATEMENT_CACHE_SIZE") or "500")
 
 engine = create_async_engine(
     clean_url.replace("postgresql://", "postgresql+asyncpg://"),
@@ -45,6 +48,7 @@ engine = create_async_engine(
     pool_size=DB_POOL_SIZE,
     max_overflow=DB_MAX_OVERFLOW,
     connect_args={
+        "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
         "server_settings": {
             "application_name": "telegram_bot",
         }
@@ -107,10 +111,10 @@ async def create_default_admin():
     
     async with AsyncSessionLocal() as session:
         try:
-            from sqlalchemy import select, func
+            from sqlalchemy import select
             
             result = await session.execute(
-                select(Publisher).where(func.lower(Publisher.email) == default_admin_email)
+                select(Publisher).where(Publisher.email == default_admin_email)
             )
             existing_admin = result.scalar_one_or_none()
             
@@ -143,6 +147,7 @@ async def create_default_admin():
 async def create_default_api_keys():
     """Create default API keys for Ads API endpoints"""
     from bot.models import ApiEndpointKey
+    from bot.server.api_auth import api_key_digest
     from sqlalchemy import select
     
     default_api_keys = [
@@ -187,6 +192,7 @@ async def create_default_api_keys():
                         endpoint_name=key_config['endpoint_name'],
                         endpoint_path=key_config['endpoint_path'],
                         api_key=key_config['api_key'],
+                        api_key_hash=api_key_digest(key_config['api_key']),
                         description=key_config['description'],
                         is_active=True
                     )
@@ -381,6 +387,13 @@ async def run_migrations():
             await conn.execute(text(
                 "CREATE INDEX IF NOT EXISTS idx_withdrawal_requests_bank_account_id ON withdrawal_requests(bank_account_id)"
             ))
+            # Back the paginated admin list, with and without a status filter
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_withdrawal_requested ON withdrawal_requests(requested_at, id)"
+            ))
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_withdrawal_status_requested ON withdrawal_requests(status, requested_at)"
+            ))
             
             # Add country and region fields to publisher_impressions table
             await conn.execute(text(
@@ -465,6 +478,14 @@ async def run_migrations():
             ))
             logger.info("Normalized all email addresses to lowercase")
             
+            # Emails are stored lowercased (normalize_email) so lookups can use exact matches on the email index
+            await conn.execute(text(
+                "ALTER TABLE publishers DROP CONSTRAINT IF EXISTS check_email_lowercase"
+            ))
+            await conn.execute(text(
+                "ALTER TABLE publishers ADD CONSTRAINT check_email_lowercase CHECK (email = LOWER(email))"
+            ))
+            
             try:
                 await conn.execute(text(
                     "CREATE UNIQUE INDEX IF NOT EXISTS idx_publishers_email_lower ON publishers (LOWER(email))"
@@ -513,6 +534,16 @@ async def run_migrations():
             await conn.execute(text(
                 "CREATE INDEX IF NOT EXISTS idx_api_endpoint_keys_api_key ON api_endpoint_keys(api_key)"
             ))
+            # Fixed-size digest of the key, so the per-request check probes a 16-byte index entry.
+            # Written by the app next to api_key (convert_to is not immutable, so it cannot be a generated column)
+            await conn.execute(text(
+                "ALTER TABLE api_endpoint_keys ADD COLUMN IF NOT EXISTS api_key_hash BYTEA"
+            ))
+            await conn.execute(text("DROP INDEX IF EXISTS idx_api_endpoint_keys_lookup"))
+            # Covers the per-request key check so it is answered from the index alone
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_api_endpoint_keys_hash_lookup ON api_endpoint_keys(api_key_hash, endpoint_name) WHERE is_active"
+            ))
             
             # Insert default API endpoints if they don't exist
             await conn.execute(text("""
@@ -535,7 +566,14 @@ async def run_migrations():
                 SELECT 'API Tracking Postback', '/api/tracking/postback', 'default_' || md5(random()::text || clock_timestamp()::text)::text, 'Video impression tracking endpoint', true
                 WHERE NOT EXISTS (SELECT 1 FROM api_endpoint_keys WHERE endpoint_name = 'API Tracking Postback')
             """))
-            
+            # Backfill digests for rows written before api_key_hash existed, the defaults above,
+            # and any key edited directly in SQL
+            await conn.execute(text("""
+                UPDATE api_endpoint_keys
+                SET api_key_hash = substring(sha256(convert_to(api_key, 'UTF8')) from 1 for 16)
+                WHERE api_key_hash IS DISTINCT FROM substring(sha256(convert_to(api_key, 'UTF8')) from 1 for 16)
+            """))
+
             # Add device fingerprint and detection fields to publisher_registrations table
             await conn.execute(text(
                 "ALTER TABLE publisher_registrations ADD COLUMN IF NOT EXISTS device_fingerprint VARCHAR(64)"
@@ -628,12 +666,21 @@ async def run_migrations():
             await conn.execute(text(
                 "CREATE INDEX IF NOT EXISTS idx_subscription_plans_active ON subscription_plans(is_active)"
             ))
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_plan_active_amount ON subscription_plans(is_active, amount)"
+            ))
             await conn.execute(text(
                 "CREATE INDEX IF NOT EXISTS idx_subscription_plan_id ON subscriptions(plan_id)"
             ))
             await conn.execute(text(
                 "CREATE INDEX IF NOT EXISTS idx_subscription_android ON subscriptions(android_id, status)"
             ))
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_subscription_publisher_created ON subscriptions(publisher_id, created_at, id)"
+            ))
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_web_sub_created ON web_publisher_subscriptions(created_at, id)"
+            ))
             
             # Insert default subscription plans if they don't exist
             await conn.execute(text("""
@@ -733,6 +780,14 @@ async def run_migrations():
             await conn.execute(text(
                 "CREATE INDEX IF NOT EXISTS idx_web_sub_expires ON web_publisher_subscriptions(publisher_id, expires_at)"
             ))
+            # Generated full-text column backing the admin payment search on order_id / UTR
+            await conn.execute(text("""
+                ALTER TABLE web_publisher_subscriptions ADD COLUMN IF NOT EXISTS search_vector tsvector
+                GENERATED ALWAYS AS (to_tsvector('simple', coalesce(order_id, '') || ' ' || coalesce(utr_number, ''))) STORED
+            """))
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_web_sub_search ON web_publisher_subscriptions USING gin (search_vector)"
+            ))
             
             # Add IPQS (IP Quality Score) integration columns to settings table
             await conn.execute(text(
@@ -778,6 +833,25 @@ async def run_migrations():
         except Exception as e:
             logger.error(f"Error running migrations: {e}")
 
+async def create_search_indexes():
+    """Create pg_trgm GIN indexes backing the admin ILIKE '%...%' searches"""
+    from sqlalchemy import text
+    
+    # Separate transaction: pg_trgm may be unavailable or need privileges the app user lacks,
+    # and that must not roll back the regular migrations
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_web_sub_order_id_trgm ON web_publisher_subscriptions USING gin (order_id gin_trgm_ops)"
+            ))
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_publisher_email_trgm ON publishers USING gin (email gin_trgm_ops)"
+            ))
+        logger.info("Search indexes ready")
+    except Exception as e:
+        logger.warning(f"Skipping trigram search indexes: {e}")
+
 async def init_db():
     """Initialize database tables"""
     # Import models to ensure they are registered
@@ -792,6 +866,7 @@ async def init_db():
         logger.info(f"Database tables already exist or initialization skipped: {e}")
     
     await run_migrations()
+    await create_search_indexes()
     await create_default_admin()
     await create_default_api_keys()
     await create_default_settings()
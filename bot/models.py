@@ -1,4 +1,5 @@
-from sqlalchemy import String, BigInteger, DateTime, Text, Boolean, Integer, Date, Float, CheckConstraint, Index, UniqueConstraint, ForeignKey
+from sqlalchemy import String, BigInteger, DateTime, Text, Boolean, Integer, Date, Float, LargeBinary, CheckConstraint, Index, UniqueConstraint, ForeignKey, Computed, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.sql import func
 from bot.database import Base
@@ -88,6 +89,7 @@ class Publisher(Base):
     __table_args__ = (
         CheckConstraint('balance >= 0', name='check_balance_non_negative'),
         CheckConstraint('custom_impression_rate IS NULL OR custom_impression_rate >= 0', name='check_custom_rate_non_negative'),
+        CheckConstraint('email = LOWER(email)', name='check_email_lowercase'),
     )
     
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -256,6 +258,7 @@ class WithdrawalRequest(Base):
     __table_args__ = (
         Index('idx_withdrawal_publisher_status', 'publisher_id', 'status'),
         Index('idx_withdrawal_status_requested', 'status', 'requested_at'),
+        Index('idx_withdrawal_requested', 'requested_at', 'id'),
     )
     
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -479,11 +482,17 @@ class ReferralReward(Base):
 class ApiEndpointKey(Base):
     """Model for storing API endpoint keys for secure access control"""
     __tablename__ = "api_endpoint_keys"
+    __table_args__ = (
+        Index('idx_api_endpoint_keys_hash_lookup', 'api_key_hash', 'endpoint_name', postgresql_where=text('is_active')),
+    )
     
     id: Mapped[int] = mapped_column(primary_key=True)
     endpoint_name: Mapped[str] = mapped_column(String(255), unique=True, index=True)
     endpoint_path: Mapped[str] = mapped_column(String(500))
     api_key: Mapped[str] = mapped_column(String(128), unique=True, index=True)
+    # First 16 bytes of SHA-256(api_key), set alongside api_key via api_auth.api_key_digest;
+    # the auth check probes this instead of the key text
+    api_key_hash: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True, deferred=True)
     description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -496,6 +505,7 @@ class SubscriptionPlan(Base):
         CheckConstraint('earning_per_link IS NULL OR earning_per_link >= 0', name='check_earning_per_link_non_negative'),
         CheckConstraint('monthly_link_limit IS NULL OR monthly_link_limit >= 0', name='check_monthly_limit_non_negative'),
         Index('idx_plan_id_active', 'id', 'is_active'),
+        Index('idx_plan_active_amount', 'is_active', 'amount'),
     )
     
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -516,6 +526,7 @@ class Subscription(Base):
         Index('idx_subscription_publisher', 'publisher_id', 'status'),
         Index('idx_subscription_order', 'order_id'),
         Index('idx_subscription_android', 'android_id', 'status'),
+        Index('idx_subscription_publisher_created', 'publisher_id', 'created_at', 'id'),
     )
     
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -560,6 +571,8 @@ class WebPublisherSubscription(Base):
         Index('idx_web_sub_publisher', 'publisher_id', 'status'),
         Index('idx_web_sub_order', 'order_id'),
         Index('idx_web_sub_expires', 'publisher_id', 'expires_at'),
+        Index('idx_web_sub_created', 'created_at', 'id'),
+        Index('idx_web_sub_search', 'search_vector', postgresql_using='gin'),
     )
     
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -579,6 +592,12 @@ class WebPublisherSubscription(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     paid_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Full-text tokens of order_id and utr_number for the admin payment search; never loaded with the row
+    search_vector: Mapped[Optional[str]] = mapped_column(
+        TSVECTOR,
+        Computed("to_tsvector('simple', coalesce(order_id, '') || ' ' || coalesce(utr_number, ''))", persisted=True),
+        deferred=True
+    )
 
 
 class IPQSApiKey(Base):
@@ -8,6 +8,44 @@ import re
 from typing import Dict, Optional, Tuple
 from user_agents import parse
 
+# Headers read by generate_device_fingerprint, in hashing order
+_DEVICE_FP_HEADERS = (
+    'Accept-Language',
+    'Accept-Encoding',
+    'Accept',
+    'DNT',
+    'Sec-CH-UA',
+    'Sec-CH-UA-Platform',
+    'Sec-CH-UA-Mobile',
+    'Sec-CH-UA-Full-Version',
+    'Upgrade-Insecure-Requests',
+    'Sec-Fetch-Site',
+    'Sec-Fetch-Mode',
+    'Sec-Fetch-Dest'
+)
+
+# Headers read by generate_hardware_fingerprint, in hashing order
+_HARDWARE_FP_HEADERS = (
+    'Sec-CH-UA',
+    'Sec-CH-UA-Platform',
+    'Sec-CH-UA-Mobile',
+    'Sec-CH-UA-Full-Version',
+    'Sec-CH-UA-Platform-Version',
+    'Sec-CH-UA-Arch',
+    'Sec-CH-UA-Model'
+)
+
+# Every header name either fingerprint reads; callers only need to pass these
+FINGERPRINT_HEADERS = frozenset(_DEVICE_FP_HEADERS + _HARDWARE_FP_HEADERS)
+
+
+def fingerprint_headers(headers) -> Dict[str, str]:
+    """
+    Pick the fingerprinting headers out of a request's headers.
+    Matches names exactly as the full dict(headers) copy did, so fingerprints are unchanged.
+    """
+    return {name: headers[name] for name in headers.keys() if name in FINGERPRINT_HEADERS}
+
 
 def parse_user_agent(user_agent: str) -> Dict[str, Optional[str]]:
     """
@@ -228,7 +266,7 @@ def generate_device_fingerprint(
     Args:
         ip_address: Client IP address
         user_agent: User agent string
-        headers: HTTP request headers for additional fingerprinting:
+        headers: HTTP request headers (or the fingerprint_headers() subset) for additional fingerprinting:
             - Accept-Language: Browser language preferences
             - Accept-Encoding: Supported encoding types
             - Accept: Supported content types
@@ -248,23 +286,7 @@ def generate_device_fingerprint(
     
     # Add HTTP headers for enhanced fingerprinting (all server-side)
     if headers:
-        # Priority headers that provide good fingerprinting data
-        priority_headers = [
-            'Accept-Language',
-            'Accept-Encoding',
-            'Accept',
-            'DNT',
-            'Sec-CH-UA',
-            'Sec-CH-UA-Platform',
-            'Sec-CH-UA-Mobile',
-            'Sec-CH-UA-Full-Version',
-            'Upgrade-Insecure-Requests',
-            'Sec-Fetch-Site',
-            'Sec-Fetch-Mode',
-            'Sec-Fetch-Dest'
-        ]
-        
-        for header in priority_headers:
+        for header in _DEVICE_FP_HEADERS:
             if header in headers and headers[header]:
                 fingerprint_components.append(f"{header}:{headers[header]}")
     
@@ -327,17 +349,7 @@ def generate_hardware_fingerprint(user_agent: str, headers: Optional[Dict[str, s
     
     # Use server-side headers that indicate hardware/platform characteristics
     if headers:
-        hardware_headers = [
-            'Sec-CH-UA',
-            'Sec-CH-UA-Platform',
-            'Sec-CH-UA-Mobile',
-            'Sec-CH-UA-Full-Version',
-            'Sec-CH-UA-Platform-Version',
-            'Sec-CH-UA-Arch',
-            'Sec-CH-UA-Model'
-        ]
-        
-        for header in hardware_headers:
+        for header in _HARDWARE_FP_HEADERS:
             if header in headers and headers[header]:
                 hardware_components.append(f"{header}:{headers[header]}")
     
@@ -1,16 +1,50 @@
 import httpx
 import logging
 import json
+import maxminddb
+from functools import lru_cache
+from os import environ, path
 from typing import Optional, Tuple
 
 logger = logging.getLogger('bot.geoip')
 
+# Local MaxMind GeoLite2 City/Country database; lookups fall back to the HTTP API when it is missing
+GEOIP_DATABASE = environ.get("GEOIP_DATABASE") or "GeoLite2-City.mmdb"
+
+_reader = None
+if path.isfile(GEOIP_DATABASE):
+    try:
+        _reader = maxminddb.open_database(GEOIP_DATABASE, mode=maxminddb.MODE_MMAP)
+        logger.info(f"Using local GeoIP database {GEOIP_DATABASE}")
+    except Exception as e:
+        logger.error(f"Could not open GeoIP database {GEOIP_DATABASE}: {e}")
+
+@lru_cache(maxsize=65536)
+def _lookup_local(ip_address: str) -> Optional[Tuple[str, str, str]]:
+    """Look up an IP in the local database; None when there is no database or no record"""
+    if _reader is None:
+        return None
+    try:
+        record = _reader.get(ip_address)
+    except ValueError:
+        return None
+    if not record or 'country' not in record:
+        return None
+    
+    country = record['country']
+    subdivisions = record.get('subdivisions')
+    country_code = country.get('iso_code', 'Unknown')
+    country_name = country.get('names', {}).get('en', 'Unknown')
+    region = subdivisions[0].get('names', {}).get('en', 'Unknown') if subdivisions else 'Unknown'
+    return country_code, country_name, region
+
 async def get_location_from_ip(ip_address: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
     """
     Get country code, country name, and region from IP address
     Returns: (country_code, country_name, region)
     
-    Uses ip-api.com HTTPS service (45 requests/minute, no API key required)
+    Uses the local GeoIP database when present, otherwise the
+    ip-api.com HTTPS service (45 requests/minute, no API key required)
     Note: HTTPS is only available for paid plans on ip-api.com. Using free HTTPS alternative.
     """
     if not ip_address or ip_address in ['127.0.0.1', 'localhost', '::1', '0.0.0.0']:
@@ -34,6 +68,10 @@ async def get_location_from_ip(ip_address: str) -> Tuple[Optional[str], Optional
         except (ValueError, IndexError):
             pass
     
+    local = _lookup_local(ip_address)
+    if local is not None:
+        return local
+    
     try:
         async with httpx.AsyncClient(timeout=5.0) as client:
             response = await client.get(
@@ -93,6 +131,10 @@ def get_location_from_ip_sync(ip_address: str) -> Tuple[Optional[str], Optional[
         except (ValueError, IndexError):
             pass
     
+    local = _lookup_local(ip_address)
+    if local is not None:
+        return local
+    
     try:
         with httpx.Client(timeout=5.0) as client:
             response = client.get(
@@ -0,0 +1,40 @@
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+_listener = None
+
+def start_queue_logging(logger_names=('uvicorn', 'uvicorn.error', 'bot')):
+    """
+    Move the handlers of the given loggers behind a QueueHandler
+    
+    Request handlers only enqueue log records; a QueueListener thread does the
+    formatting and the file/stream writes. Call after uvicorn has applied its
+    log config, since dictConfig would replace the queue handler again.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    handlers = []
+    
+    for name in logger_names:
+        target = logging.getLogger(name)
+        for handler in target.handlers:
+            if handler not in handlers:
+                handlers.append(handler)
+        target.handlers = [queue_handler]
+    
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+def stop_queue_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is None:
+        return
+    
+    _listener.stop()
+    _listener = None
@@ -3,11 +3,17 @@ from uvicorn import Server as UvicornServer, Config
 from logging import getLogger
 from bot.config import Server, LOGGER_CONFIG_JSON
 from bot.database import init_db, close_db
+from bot.server.ipqs_service import close_ipqs_session, release_ipqs_lease
+from bot.server.encryption import get_encryption_manager
+from bot.modules.queue_logging import start_queue_logging, stop_queue_logging
 from secrets import token_hex
 from datetime import timedelta
 from pathlib import Path
+from tempfile import gettempdir
+from jinja2 import FileSystemBytecodeCache
+import asyncio
 
-from . import main, error, auth, admin, publisher, ad_api, payment_api
+from . import main, error, auth, admin, publisher, ad_api, payment_api, login_event_sink
 
 logger = getLogger('uvicorn')
 
@@ -39,6 +45,11 @@ instance.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 instance.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
 instance.config['SESSION_COOKIE_NAME'] = 'session'
 
+# Persist compiled template bytecode so fresh workers skip Jinja compilation
+_jinja_cache_dir = Path(environ.get('JINJA_CACHE_DIR', Path(gettempdir()) / 'jinja_cache'))
+_jinja_cache_dir.mkdir(parents=True, exist_ok=True)
+instance.jinja_env.bytecode_cache = FileSystemBytecodeCache(str(_jinja_cache_dir))
+
 @instance.after_request
 async def add_security_headers(response):
     """Add security headers to all responses"""
@@ -66,26 +77,23 @@ async def add_security_headers(response):
 @instance.context_processor
 async def inject_settings():
     """Make settings available to all templates"""
-    from bot.database import AsyncSessionLocal
-    from bot.models import Settings
-    from sqlalchemy import select
+    from bot.server.settings_cache import get_cached_settings
     
-    async with AsyncSessionLocal() as session:
-        try:
-            result = await session.execute(select(Settings))
-            settings = result.scalar_one_or_none()
-            
-            return {
-                'settings': settings,
-                'app_logo': settings.logo_path if settings and settings.logo_path else None,
-                'app_favicon': settings.favicon_path if settings and settings.favicon_path else None
-            }
-        except Exception:
-            return {
-                'settings': None,
-                'app_logo': None,
-                'app_favicon': None
-            }
+    # Cached, so rendering a page does not add a Settings query to every handler's budget
+    try:
+        settings = await get_cached_settings()
+        
+        return {
+            'settings': settings,
+            'app_logo': settings.logo_path if settings and settings.logo_path else None,
+            'app_favicon': settings.favicon_path if settings and settings.favicon_path else None
+        }
+    except Exception:
+        return {
+            'settings': None,
+            'app_logo': None,
+            'app_favicon': None
+        }
 
 @instance.before_request
 async def check_maintenance_mode():
@@ -110,7 +118,12 @@ async def check_maintenance_mode():
 
 @instance.before_serving
 async def before_serve():
+    start_queue_logging()
     await init_db()
+    login_event_sink.start()
+    # Generate the login-form key pairs in a worker thread so the first login page render
+    # never does it on the event loop
+    await asyncio.to_thread(get_encryption_manager)
     
     # Initialize default API keys automatically
     from bot.server.admin.api_keys_routes import initialize_default_api_keys
@@ -128,8 +141,12 @@ async def before_serve():
 
 @instance.after_serving
 async def after_serve():
+    await login_event_sink.stop()
+    await release_ipqs_lease()
+    await close_ipqs_session()
     await close_db()
     logger.info('Web server is shutting down!')
+    stop_queue_logging()
 
 instance.register_blueprint(main.bp)
 instance.register_blueprint(auth.bp)
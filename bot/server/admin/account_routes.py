@@ -2,9 +2,9 @@ from quart import Blueprint, request, render_template, redirect, session, jsonif
 from bot.database import AsyncSessionLocal
 from bot.models import Publisher
 from sqlalchemy import select
-from .utils import require_admin, hash_password
+from .utils import require_admin
+from bot.server.auth import hash_password, verify_password
 from bot.server.security import csrf_protect, get_csrf_token
-import bcrypt
 from logging import getLogger
 
 logger = getLogger('uvicorn')
@@ -68,7 +68,7 @@ async def update_email():
                 }), 404
             
             # Verify current password
-            if not bcrypt.checkpw(current_password.encode('utf-8'), admin_user.password_hash.encode('utf-8')):
+            if not await verify_password(current_password, admin_user.password_hash):
                 logger.warning(f"Failed email change attempt for admin {admin_user.email} - incorrect password")
                 return jsonify({
                     'success': False,
@@ -97,6 +97,7 @@ async def update_email():
             
             # Update session
             session['publisher_email'] = new_email
+            session['admin_user'] = {'id': admin_user.id, 'email': new_email}
             
             logger.info(f"Admin email changed from {old_email} to {new_email}")
             
@@ -158,7 +159,7 @@ async def update_password():
                 }), 404
             
             # Verify current password
-            if not bcrypt.checkpw(current_password.encode('utf-8'), admin_user.password_hash.encode('utf-8')):
+            if not await verify_password(current_password, admin_user.password_hash):
                 logger.warning(f"Failed password change attempt for admin {admin_user.email} - incorrect password")
                 return jsonify({
                     'success': False,
@@ -166,7 +167,7 @@ async def update_password():
                 }), 401
             
             # Update password
-            admin_user.password_hash = hash_password(new_password)
+            admin_user.password_hash = await hash_password(new_password)
             await db_session.commit()
             
             logger.info(f"Admin password changed for {admin_user.email}")
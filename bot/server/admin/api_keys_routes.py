@@ -3,6 +3,7 @@ from bot.database import AsyncSessionLocal
 from bot.models import ApiEndpointKey
 from sqlalchemy import select, text
 from .utils import require_admin
+from bot.server.api_auth import api_key_digest
 from bot.server.security import csrf_protect, get_csrf_token
 from secrets import token_hex
 import logging
@@ -75,10 +76,12 @@ async def initialize_default_api_keys():
                 existing = result.scalar_one_or_none()
                 
                 if not existing:
+                    generated_key = token_hex(32)
                     new_key = ApiEndpointKey(
                         endpoint_name=default_key['endpoint_name'],
                         endpoint_path=default_key['endpoint_path'],
-                        api_key=token_hex(32),
+                        api_key=generated_key,
+                        api_key_hash=api_key_digest(generated_key),
                         description=default_key['description'],
                         is_active=True
                     )
@@ -124,6 +127,7 @@ async def add_api_key():
                 endpoint_name=endpoint_name,
                 endpoint_path=endpoint_path,
                 api_key=api_key,
+                api_key_hash=api_key_digest(api_key),
                 description=description,
                 is_active=True
             )
@@ -165,6 +169,7 @@ async def edit_api_key(key_id: int):
             
             if manual_api_key:
                 api_key.api_key = manual_api_key
+                api_key.api_key_hash = api_key_digest(manual_api_key)
             
             await db_session.commit()
             return redirect('/admin/api-keys?success=API key updated successfully')
@@ -212,6 +217,7 @@ async def regenerate_api_key(key_id: int):
             
             # Generate new API key
             api_key.api_key = token_hex(32)
+            api_key.api_key_hash = api_key_digest(api_key.api_key)
             await db_session.commit()
             
             return redirect('/admin/api-keys?success=API key regenerated successfully')
@@ -1,9 +1,10 @@
 from quart import Blueprint, request, render_template, redirect, session
 from bot.database import AsyncSessionLocal
 from bot.models import Publisher, File, PublisherImpression, ImpressionAdjustment, PublisherRegistration, Settings
-from bot.server.security import csrf_protect, get_csrf_token
+from bot.server.security import csrf_protect, get_csrf_token, normalize_email
 from sqlalchemy import select, func, delete
-from .utils import require_admin, hash_password
+from .utils import require_admin
+from bot.server.auth import hash_password
 from datetime import datetime, timezone
 from bot.modules.geoip import get_location_from_ip
 from bot.server.referral_helper import create_referral_code_for_publisher
@@ -30,7 +31,7 @@ bp = Blueprint('admin_publishers', __name__)
 @csrf_protect
 async def register_publisher():
     data = await request.form
-    email = data.get('email', '').strip()
+    email = normalize_email(data.get('email', ''))
     password = data.get('password', '')
     traffic_source = data.get('traffic_source', '').strip()
     is_admin = data.get('is_admin') == 'on'
@@ -77,7 +78,7 @@ async def register_publisher():
         
         try:
             result = await db_session.execute(
-                select(Publisher).where(func.lower(Publisher.email) == email.lower())
+                select(Publisher).where(Publisher.email == email)
             )
             existing = result.scalar_one_or_none()
             
@@ -91,7 +92,7 @@ async def register_publisher():
                                               error='Email already registered',
                                               csrf_token=csrf_token)
             
-            password_hash = hash_password(password)
+            password_hash = await hash_password(password)
             
             publisher = Publisher(
                 email=email,
@@ -7,6 +7,16 @@ from bot.server.security import get_csrf_token, csrf_protect
 
 bp = Blueprint('admin_referrals', __name__)
 
+_Q_REFERRAL_STATS = select(
+    select(func.count(Referral.id)).scalar_subquery(),
+    select(func.sum(ReferralReward.reward_amount))
+    .where(ReferralReward.status == 'credited')
+    .scalar_subquery(),
+    select(func.count(func.distinct(Referral.referrer_id)))
+    .where(Referral.status == 'active')
+    .scalar_subquery(),
+)
+
 @bp.route('/referral-settings')
 @require_admin
 async def referral_settings():
@@ -33,11 +43,9 @@ async def referral_settings():
             db_session.add(settings)
             await db_session.commit()
         
-        total_referrals = await db_session.scalar(select(func.count(Referral.id)))
-        total_rewards = await db_session.scalar(select(func.sum(ReferralReward.reward_amount)).where(ReferralReward.status == 'credited'))
-        active_referrers = await db_session.scalar(
-            select(func.count(func.distinct(Referral.referrer_id))).where(Referral.status == 'active')
-        )
+        # All three stats in one round trip
+        stats = (await db_session.execute(_Q_REFERRAL_STATS)).one()
+        total_referrals, total_rewards, active_referrers = stats
         
         csrf_token = get_csrf_token()
         return await render_template(
@@ -123,31 +131,33 @@ async def referrals():
         )
         referrals = result.scalars().all()
         
-        referral_data = []
-        for ref in referrals:
-            referrer_result = await db_session.execute(
-                select(Publisher).where(Publisher.id == ref.referrer_id)
+        # One query each for the page's publishers and rewards instead of three per referral
+        publishers = {}
+        rewards_by_referral = {ref.id: [] for ref in referrals}
+        if referrals:
+            publisher_ids = {ref.referrer_id for ref in referrals} | {ref.referred_publisher_id for ref in referrals}
+            publisher_result = await db_session.execute(
+                select(Publisher).where(Publisher.id.in_(publisher_ids))
             )
-            referrer = referrer_result.scalar_one_or_none()
-            
-            referred_result = await db_session.execute(
-                select(Publisher).where(Publisher.id == ref.referred_publisher_id)
-            )
-            referred = referred_result.scalar_one_or_none()
+            publishers = {publisher.id: publisher for publisher in publisher_result.scalars()}
             
             rewards_result = await db_session.execute(
                 select(ReferralReward)
-                .where(ReferralReward.referral_id == ref.id)
+                .where(ReferralReward.referral_id.in_(rewards_by_referral))
                 .order_by(ReferralReward.created_at.desc())
             )
-            rewards = rewards_result.scalars().all()
-            
-            referral_data.append({
+            for reward in rewards_result.scalars():
+                rewards_by_referral[reward.referral_id].append(reward)
+        
+        referral_data = [
+            {
                 'referral': ref,
-                'referrer': referrer,
-                'referred': referred,
-                'rewards': rewards
-            })
+                'referrer': publishers.get(ref.referrer_id),
+                'referred': publishers.get(ref.referred_publisher_id),
+                'rewards': rewards_by_referral[ref.id]
+            }
+            for ref in referrals
+        ]
         
         total_pages = (total_referrals + per_page - 1) // per_page if total_referrals else 1
         
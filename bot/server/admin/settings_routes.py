@@ -5,6 +5,7 @@ from bot.models import Settings
 from sqlalchemy import select
 from .utils import require_admin
 from bot.server.security import csrf_protect, get_csrf_token
+from bot.server.settings_cache import invalidate_settings_cache
 from pathlib import Path
 from secrets import token_hex
 import os
@@ -246,6 +247,7 @@ async def update_settings():
             
             try:
                 await db_session.commit()
+                invalidate_settings_cache()
                 # Print to logs for debugging
                 print("✓ Settings and logo saved successfully to database")
                 
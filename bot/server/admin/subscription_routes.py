@@ -1,61 +1,215 @@
-from quart import Blueprint, request, render_template, redirect, session, jsonify
+from quart import Blueprint, request, render_template, redirect, session
 from bot.database import AsyncSessionLocal
-from bot.models import Subscription, Publisher, Settings, SubscriptionPlan
-from sqlalchemy import select, desc
-from .utils import require_admin
+from bot.models import Subscription, Settings, SubscriptionPlan
+from sqlalchemy import select, desc, update, func, tuple_, bindparam
+from .utils import require_admin, fast_jsonify, json_dumps, json_loads
 from bot.server.security import csrf_protect, get_csrf_token
+from bot.server.settings_cache import get_cached_settings, invalidate_settings_cache
 from logging import getLogger
 from datetime import datetime, timedelta
 from os import environ
-import string
+import base64
 import secrets
 import httpx
-import json
 import urllib.parse
+import asyncio
+import time
 
 logger = getLogger('uvicorn')
 bp = Blueprint('admin_subscription', __name__)
 
+# Paytm configuration is fixed for the lifetime of the process
+_PAYTM_UPI_ID = environ.get('PAYTM_UPI_ID')
+_PAYTM_UNIT_ID = environ.get('PAYTM_UNIT_ID')
+_PAYTM_SIGNATURE = environ.get('PAYTM_SIGNATURE')
+_PAYTM_MID = environ.get('PAYTM_MID')
+_PAYTM_CONFIGURED = all([_PAYTM_UPI_ID, _PAYTM_UNIT_ID, _PAYTM_SIGNATURE])
+
+if not _PAYTM_CONFIGURED:
+    logger.warning("Missing required Paytm environment variables - admin subscription payments are disabled")
+
+_UPI_LINK_TEMPLATE = f"upi://pay?pa={_PAYTM_UPI_ID}&am={{amount}}&pn={_PAYTM_UNIT_ID}&tn={{order_id}}&tr={{order_id}}"
+_PAYTM_INTENT_TEMPLATE = f"paytmmp://cash_wallet?pa={_PAYTM_UPI_ID}&pn={_PAYTM_UNIT_ID}&am={{amount}}&cu=INR&tn={{order_id}}&tr={{order_id}}&mc=4722&sign={_PAYTM_SIGNATURE}&featuretype=money_transfer"
+_QR_CODE_BASE_URL = "https://api.qrserver.com/v1/create-qr-code/?size=300x300&ecc=H&margin=20&data="
+_PAYTM_STATUS_URL_PREFIX = "https://securegw.paytm.in/order/status?JsonData=" + urllib.parse.quote(
+    '{"MID":' + json_dumps(_PAYTM_MID) + ',"ORDERID":"'
+)
+_PAYTM_STATUS_URL_SUFFIX = urllib.parse.quote('"}')
+
+# Shared client so status checks reuse pooled keep-alive connections to Paytm
+_paytm_client = httpx.AsyncClient(
+    timeout=10.0,
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+    headers={"Content-Type": "application/json"}
+)
+
+@bp.after_app_serving
+async def close_paytm_client():
+    await _paytm_client.aclose()
+
+# Columns rendered by the plan list and plan JSON; avoids hydrating full ORM rows
+_PLAN_COLUMNS = (
+    SubscriptionPlan.id,
+    SubscriptionPlan.name,
+    SubscriptionPlan.amount,
+    SubscriptionPlan.duration_days,
+    SubscriptionPlan.description,
+    SubscriptionPlan.is_active
+)
+
+# Columns shown in the subscription history table plus the id for the page cursor
+_SUBSCRIPTION_COLUMNS = (
+    Subscription.id,
+    Subscription.order_id,
+    Subscription.plan_name,
+    Subscription.amount,
+    Subscription.status,
+    Subscription.created_at,
+    Subscription.expires_at
+)
+
+SUBSCRIPTIONS_PAGE_SIZE = 50
+
+# Hot statements built once; per-request values are passed as bind parameters
+_Q_ACTIVE_PLANS = (
+    select(*_PLAN_COLUMNS)
+    .where(SubscriptionPlan.is_active == True)
+    .order_by(SubscriptionPlan.amount)
+)
+_Q_ALL_PLANS = select(*_PLAN_COLUMNS).order_by(SubscriptionPlan.amount)
+_Q_SUBSCRIPTIONS_FIRST_PAGE = (
+    select(*_SUBSCRIPTION_COLUMNS)
+    .where(Subscription.publisher_id == bindparam('pid'))
+    .order_by(desc(Subscription.created_at), desc(Subscription.id))
+    .limit(SUBSCRIPTIONS_PAGE_SIZE + 1)
+)
+_Q_SUBSCRIPTIONS_AFTER_CURSOR = _Q_SUBSCRIPTIONS_FIRST_PAGE.where(
+    tuple_(Subscription.created_at, Subscription.id) < tuple_(
+        bindparam('before', type_=Subscription.created_at.type),
+        bindparam('before_id', type_=Subscription.id.type)
+    )
+)
+_Q_PAYMENT_STATUS = select(Subscription.id, Subscription.status, Subscription.duration_days).where(
+    Subscription.order_id == bindparam('order_id'),
+    Subscription.publisher_id == bindparam('pid')
+)
+# Guarded on status so overlapping polls apply a result once, and a late failure cannot undo a completion
+_Q_COMPLETE_SUBSCRIPTION = (
+    update(Subscription)
+    .where(Subscription.id == bindparam('subscription_id'), Subscription.status != 'completed')
+    .values(
+        status='completed',
+        utr_number=bindparam('utr'),
+        paid_at=bindparam('paid_at', type_=Subscription.paid_at.type),
+        expires_at=bindparam('expires_at', type_=Subscription.expires_at.type)
+    )
+    .returning(Subscription.id)
+)
+_Q_FAIL_SUBSCRIPTION = (
+    update(Subscription)
+    .where(Subscription.id == bindparam('subscription_id'), Subscription.status != 'completed')
+    .values(status='failed')
+    .returning(Subscription.id)
+)
+
+# (form field, caster, default when blank, validity check, error message) for add_plan
+_PLAN_FIELD_SPECS = (
+    ('amount', float, None, lambda v: v > 0, 'Amount must be greater than 0'),
+    ('duration_days', int, None, lambda v: v > 0, 'Duration must be greater than 0 days'),
+    ('earning_per_link', float, 0.0, lambda v: v >= 0, 'Earning per link cannot be negative'),
+    ('monthly_link_limit', int, 0, lambda v: v >= 0, 'Monthly link limit cannot be negative')
+)
+
+# Pre-rendered plan cards, keyed by (plans version, subscriptions enabled).
+# The TTL bounds staleness for plan edits made by other worker processes.
+PLANS_FRAGMENT_TTL = 30.0
+_plans_version = 0
+_plans_fragment = {'key': None, 'html': None, 'expires': 0.0}
+
+def _bump_plans_version():
+    """Invalidate the pre-rendered plan cards after a plan is added or removed"""
+    global _plans_version
+    _plans_version += 1
+
 def generate_order_id(length=20):
-    """Generate a random order ID"""
-    characters = string.ascii_uppercase + string.digits
-    return ''.join(secrets.choice(characters) for _ in range(length))
+    """Generate a random order ID from the A-Z/2-7 base32 alphabet"""
+    raw = secrets.token_bytes((length * 5 + 7) // 8)
+    return base64.b32encode(raw).decode('ascii')[:length]
+
+async def _load_subscriptions(publisher_id, before=None, before_id=None):
+    """Load one page of subscriptions, newest first, starting after the (created_at, id) cursor"""
+    if before is None:
+        query, params = _Q_SUBSCRIPTIONS_FIRST_PAGE, {'pid': publisher_id}
+    else:
+        query, params = _Q_SUBSCRIPTIONS_AFTER_CURSOR, {'pid': publisher_id, 'before': before, 'before_id': before_id}
+    
+    async with AsyncSessionLocal() as db_session:
+        result = await db_session.execute(query, params)
+        return result.all()
+
+async def _load_active_plans():
+    async with AsyncSessionLocal() as db_session:
+        result = await db_session.execute(_Q_ACTIVE_PLANS)
+        return result.all()
+
+async def _render_plans_fragment(subscriptions_enabled):
+    """Return the plan cards HTML, re-rendering only when plans or the toggle changed"""
+    key = (_plans_version, subscriptions_enabled)
+    now = time.monotonic()
+    if _plans_fragment['key'] == key and now < _plans_fragment['expires']:
+        return _plans_fragment['html']
+    
+    plans = await _load_active_plans()
+    html = await render_template(
+        'admin_subscriptions_plans.html',
+        plans=plans,
+        subscriptions_enabled=subscriptions_enabled
+    )
+    _plans_fragment.update(key=key, html=html, expires=now + PLANS_FRAGMENT_TTL)
+    return html
 
 @bp.route('/subscriptions')
 @require_admin
 async def subscriptions():
     """Display admin subscriptions page"""
-    async with AsyncSessionLocal() as db_session:
-        settings_result = await db_session.execute(select(Settings))
-        settings = settings_result.scalar_one_or_none()
-        
-        subscriptions_enabled = settings.subscriptions_enabled if settings else False
-        
-        result = await db_session.execute(
-            select(Subscription)
-            .where(Subscription.publisher_id == session['publisher_id'])
-            .order_by(desc(Subscription.created_at))
-        )
-        subscriptions = result.scalars().all()
-        
-        plans_result = await db_session.execute(
-            select(SubscriptionPlan)
-            .where(SubscriptionPlan.is_active == True)
-            .order_by(SubscriptionPlan.amount)
-        )
-        plans = plans_result.scalars().all()
-        
-        result = await db_session.execute(
-            select(Publisher).where(Publisher.id == session['publisher_id'])
-        )
-        admin_user = result.scalar_one_or_none()
+    publisher_id = session['publisher_id']
+    
+    # Keyset cursor: ?before=<created_at ISO timestamp>&before_id=<subscription id>
+    before = None
+    before_id = None
+    try:
+        if request.args.get('before'):
+            before = datetime.fromisoformat(request.args['before'])
+            before_id = int(request.args.get('before_id', 0))
+    except ValueError:
+        before = None
+    
+    settings = await get_cached_settings()
+    subscriptions_enabled = settings.subscriptions_enabled if settings else False
+    
+    # Each query runs on its own session so the round-trips overlap
+    subscriptions, plans_html = await asyncio.gather(
+        _load_subscriptions(publisher_id, before, before_id),
+        _render_plans_fragment(subscriptions_enabled)
+    )
+    
+    # Cached at login; fall back to the session email for older sessions
+    admin_user = session.get('admin_user') or {'id': publisher_id, 'email': session.get('publisher_email')}
+    
+    next_cursor = None
+    if len(subscriptions) > SUBSCRIPTIONS_PAGE_SIZE:
+        subscriptions = subscriptions[:SUBSCRIPTIONS_PAGE_SIZE]
+        last = subscriptions[-1]
+        next_cursor = {'before': last.created_at.isoformat(), 'before_id': last.id}
     
     csrf_token = get_csrf_token()
     return await render_template(
         'admin_subscriptions.html',
         active_page='subscriptions',
         subscriptions=subscriptions,
-        plans=plans,
+        next_cursor=next_cursor,
+        plans_html=plans_html,
         subscriptions_enabled=subscriptions_enabled,
         admin_user=admin_user,
         csrf_token=csrf_token
@@ -68,43 +222,46 @@ async def toggle_subscriptions():
     """Toggle subscriptions on/off"""
     async with AsyncSessionLocal() as db_session:
         try:
-            result = await db_session.execute(select(Settings))
-            settings = result.scalar_one_or_none()
+            # Flip the flag in a single atomic UPDATE ... RETURNING
+            result = await db_session.execute(
+                update(Settings)
+                .values(subscriptions_enabled=~func.coalesce(Settings.subscriptions_enabled, False))
+                .returning(Settings.subscriptions_enabled)
+            )
+            enabled = result.scalar()
             
-            if not settings:
-                settings = Settings()
-                db_session.add(settings)
+            if enabled is None:
+                db_session.add(Settings(subscriptions_enabled=True))
+                enabled = True
             
-            settings.subscriptions_enabled = not settings.subscriptions_enabled
             await db_session.commit()
+            invalidate_settings_cache()
             
-            logger.info(f"Subscriptions {'enabled' if settings.subscriptions_enabled else 'disabled'} by admin {session.get('publisher_email')}")
+            logger.info(f"Subscriptions {'enabled' if enabled else 'disabled'} by admin {session.get('publisher_email')}")
             
-            return jsonify({
+            return fast_jsonify({
                 'success': True,
-                'enabled': settings.subscriptions_enabled,
-                'message': f"Subscriptions {'enabled' if settings.subscriptions_enabled else 'disabled'} successfully"
-            }), 200
+                'enabled': enabled,
+                'message': f"Subscriptions {'enabled' if enabled else 'disabled'} successfully"
+            }, 200)
             
         except Exception as e:
             await db_session.rollback()
             logger.error(f"Error toggling subscriptions: {str(e)}")
-            return jsonify({
+            return fast_jsonify({
                 'success': False,
                 'message': 'Failed to update subscription settings'
-            }), 500
+            }, 500)
 
 @bp.route('/subscriptions/plans', methods=['GET'])
 @require_admin
 async def get_plans():
     """Get all subscription plans"""
     async with AsyncSessionLocal() as db_session:
-        result = await db_session.execute(
-            select(SubscriptionPlan).order_by(SubscriptionPlan.amount)
-        )
-        plans = result.scalars().all()
+        result = await db_session.execute(_Q_ALL_PLANS)
+        plans = result.all()
         
-        return jsonify({
+        return fast_jsonify({
             'success': True,
             'plans': [{
                 'id': plan.id,
@@ -114,7 +271,7 @@ async def get_plans():
                 'description': plan.description,
                 'is_active': plan.is_active
             } for plan in plans]
-        }), 200
+        }, 200)
 
 @bp.route('/subscriptions/plans/add', methods=['POST'])
 @require_admin
@@ -123,52 +280,34 @@ async def add_plan():
     """Add a new subscription plan"""
     data = await request.form
     name = data.get('name', '').strip()
-    amount = data.get('amount', '')
-    duration_days = data.get('duration_days', '')
     description = data.get('description', '').strip()
-    earning_per_link = data.get('earning_per_link', '0')
-    monthly_link_limit = data.get('monthly_link_limit', '0')
     
-    if not name or not amount or not duration_days:
-        return jsonify({
+    if not name or not data.get('amount') or not data.get('duration_days'):
+        return fast_jsonify({
             'success': False,
             'message': 'Name, amount, and duration are required'
-        }), 400
+        }, 400)
     
+    values = {}
     try:
-        amount = float(amount)
-        duration_days = int(duration_days)
-        earning_per_link = float(earning_per_link) if earning_per_link else 0.0
-        monthly_link_limit = int(monthly_link_limit) if monthly_link_limit else 0
-        
-        if amount <= 0:
-            return jsonify({
-                'success': False,
-                'message': 'Amount must be greater than 0'
-            }), 400
-            
-        if duration_days <= 0:
-            return jsonify({
-                'success': False,
-                'message': 'Duration must be greater than 0 days'
-            }), 400
-        
-        if earning_per_link < 0:
-            return jsonify({
-                'success': False,
-                'message': 'Earning per link cannot be negative'
-            }), 400
-        
-        if monthly_link_limit < 0:
-            return jsonify({
-                'success': False,
-                'message': 'Monthly link limit cannot be negative'
-            }), 400
+        for field, cast, default, is_valid, message in _PLAN_FIELD_SPECS:
+            raw = data.get(field, '')
+            values[field] = cast(raw) if raw else default
+            if not is_valid(values[field]):
+                return fast_jsonify({
+                    'success': False,
+                    'message': message
+                }, 400)
     except ValueError:
-        return jsonify({
+        return fast_jsonify({
             'success': False,
             'message': 'Invalid amount, duration, or earning format'
-        }), 400
+        }, 400)
+    
+    amount = values['amount']
+    duration_days = values['duration_days']
+    earning_per_link = values['earning_per_link']
+    monthly_link_limit = values['monthly_link_limit']
     
     async with AsyncSessionLocal() as db_session:
         try:
@@ -183,10 +322,11 @@ async def add_plan():
             )
             db_session.add(plan)
             await db_session.commit()
+            _bump_plans_version()
             
             logger.info(f"New subscription plan added: {name} (earning: {earning_per_link}/link, limit: {monthly_link_limit}/month) by admin {session.get('publisher_email')}")
             
-            return jsonify({
+            return fast_jsonify({
                 'success': True,
                 'message': 'Subscription plan added successfully',
                 'plan': {
@@ -198,15 +338,15 @@ async def add_plan():
                     'earning_per_link': plan.earning_per_link,
                     'monthly_link_limit': plan.monthly_link_limit
                 }
-            }), 200
+            }, 200)
             
         except Exception as e:
             await db_session.rollback()
             logger.error(f"Error adding subscription plan: {str(e)}")
-            return jsonify({
+            return fast_jsonify({
                 'success': False,
                 'message': 'Failed to add subscription plan'
-            }), 500
+            }, 500)
 
 @bp.route('/subscriptions/plans/<int:plan_id>/delete', methods=['POST'])
 @require_admin
@@ -215,34 +355,32 @@ async def delete_plan(plan_id):
     """Delete a subscription plan"""
     async with AsyncSessionLocal() as db_session:
         try:
-            result = await db_session.execute(
-                select(SubscriptionPlan).where(SubscriptionPlan.id == plan_id)
-            )
-            plan = result.scalar_one_or_none()
+            plan = await db_session.get(SubscriptionPlan, plan_id)
             
             if not plan:
-                return jsonify({
+                return fast_jsonify({
                     'success': False,
                     'message': 'Plan not found'
-                }), 404
+                }, 404)
             
             await db_session.delete(plan)
             await db_session.commit()
+            _bump_plans_version()
             
             logger.info(f"Subscription plan deleted: {plan.name} by admin {session.get('publisher_email')}")
             
-            return jsonify({
+            return fast_jsonify({
                 'success': True,
                 'message': 'Subscription plan deleted successfully'
-            }), 200
+            }, 200)
             
         except Exception as e:
             await db_session.rollback()
             logger.error(f"Error deleting subscription plan: {str(e)}")
-            return jsonify({
+            return fast_jsonify({
                 'success': False,
                 'message': 'Failed to delete subscription plan'
-            }), 500
+            }, 500)
 
 @bp.route('/subscriptions/create-payment', methods=['POST'])
 @require_admin
@@ -253,43 +391,43 @@ async def create_payment():
     plan_id = data.get('plan_id', '')
     
     if not plan_id:
-        return jsonify({
+        return fast_jsonify({
             'success': False,
             'message': 'Plan ID is required'
-        }), 400
+        }, 400)
     
     try:
         plan_id = int(plan_id)
     except ValueError:
-        return jsonify({
+        return fast_jsonify({
             'success': False,
             'message': 'Invalid plan ID'
-        }), 400
+        }, 400)
+    
+    if not _PAYTM_CONFIGURED:
+        logger.error("Missing required Paytm environment variables")
+        return fast_jsonify({
+            'success': False,
+            'message': 'Payment gateway not configured. Please contact administrator.'
+        }, 500)
+    
+    settings = await get_cached_settings()
+    
+    if not settings or not settings.subscriptions_enabled:
+        return fast_jsonify({
+            'success': False,
+            'message': 'Subscriptions are currently disabled'
+        }, 400)
     
     async with AsyncSessionLocal() as db_session:
         try:
-            settings_result = await db_session.execute(select(Settings))
-            settings = settings_result.scalar_one_or_none()
+            plan = await db_session.get(SubscriptionPlan, plan_id)
             
-            if not settings or not settings.subscriptions_enabled:
-                return jsonify({
-                    'success': False,
-                    'message': 'Subscriptions are currently disabled'
-                }), 400
-            
-            plan_result = await db_session.execute(
-                select(SubscriptionPlan).where(
-                    SubscriptionPlan.id == plan_id,
-                    SubscriptionPlan.is_active == True
-                )
-            )
-            plan = plan_result.scalar_one_or_none()
-            
-            if not plan:
-                return jsonify({
+            if not plan or not plan.is_active:
+                return fast_jsonify({
                     'success': False,
                     'message': 'Plan not found or inactive'
-                }), 404
+                }, 404)
             
             order_id = generate_order_id()
             
@@ -306,47 +444,30 @@ async def create_payment():
             db_session.add(subscription)
             await db_session.commit()
             
-            upi_id = environ.get('PAYTM_UPI_ID')
-            unit_id = environ.get('PAYTM_UNIT_ID')
-            paytm_signature = environ.get('PAYTM_SIGNATURE')
-            
-            if not all([upi_id, unit_id, paytm_signature]):
-                logger.error("Missing required Paytm environment variables")
-                return jsonify({
-                    'success': False,
-                    'message': 'Payment gateway not configured. Please contact administrator.'
-                }), 500
-            
-            upi_link = f"upi://pay?pa={upi_id}&am={plan.amount}&pn={unit_id}&tn={order_id}&tr={order_id}"
-            qr_url = f"https://api.qrserver.com/v1/create-qr-code/?size=300x300&ecc=H&margin=20&data={urllib.parse.quote(upi_link)}"
-            
-            if paytm_signature:
-                paytm_intent = f"paytmmp://cash_wallet?pa={upi_id}&pn={unit_id}&am={plan.amount}&cu=INR&tn={order_id}&tr={order_id}&mc=4722&sign={paytm_signature}&featuretype=money_transfer"
-            else:
-                paytm_intent = f"paytmmp://cash_wallet?pa={upi_id}&pn={unit_id}&am={plan.amount}&cu=INR&tn={order_id}&tr={order_id}&mc=4722&featuretype=money_transfer"
-            
-            mid = environ.get('PAYTM_MID')
+            upi_link = _UPI_LINK_TEMPLATE.format(amount=plan.amount, order_id=order_id)
+            qr_url = _QR_CODE_BASE_URL + urllib.parse.quote(upi_link)
+            paytm_intent = _PAYTM_INTENT_TEMPLATE.format(amount=plan.amount, order_id=order_id)
             
             logger.info(f"Payment order created: {order_id} for plan {plan.name} by admin {session.get('publisher_email')}")
             
-            return jsonify({
+            return fast_jsonify({
                 'success': True,
                 'order_id': order_id,
                 'qr_url': qr_url,
                 'paytm_intent': paytm_intent,
                 'upi_link': upi_link,
                 'amount': plan.amount,
-                'upi_id': upi_id,
-                'mid': mid
-            }), 200
+                'upi_id': _PAYTM_UPI_ID,
+                'mid': _PAYTM_MID
+            }, 200)
             
         except Exception as e:
             await db_session.rollback()
             logger.error(f"Error creating payment order: {str(e)}")
-            return jsonify({
+            return fast_jsonify({
                 'success': False,
                 'message': 'An error occurred while creating payment order'
-            }), 500
+            }, 500)
 
 @bp.route('/subscriptions/check-status/<order_id>', methods=['GET'])
 @require_admin
@@ -354,94 +475,108 @@ async def check_payment_status(order_id):
     """Check payment status from Paytm using the working code pattern"""
     async with AsyncSessionLocal() as db_session:
         try:
+            # Lightweight projection: polling clients mostly hit the early returns below
             result = await db_session.execute(
-                select(Subscription).where(
-                    Subscription.order_id == order_id,
-                    Subscription.publisher_id == session['publisher_id']
-                )
+                _Q_PAYMENT_STATUS,
+                {'order_id': order_id, 'pid': session['publisher_id']}
             )
-            subscription = result.scalar_one_or_none()
+            subscription_row = result.first()
             
-            if not subscription:
-                return jsonify({
+            if not subscription_row:
+                return fast_jsonify({
                     'success': False,
                     'message': 'Subscription not found'
-                }), 404
+                }, 404)
             
-            if subscription.status == 'completed':
-                return jsonify({
+            if subscription_row.status == 'completed':
+                return fast_jsonify({
                     'success': True,
                     'status': 'completed',
                     'message': 'Payment already completed'
-                }), 200
-            
-            mid = environ.get('PAYTM_MID')
+                }, 200)
             
-            if not mid:
+            if not _PAYTM_MID:
                 logger.error("Missing PAYTM_MID environment variable")
-                return jsonify({
+                return fast_jsonify({
                     'success': False,
                     'message': 'Payment verification not configured'
-                }), 500
-            
-            payload = json.dumps({'MID': mid, 'ORDERID': order_id})
-            check_url = f"https://securegw.paytm.in/order/status?JsonData={urllib.parse.quote(payload)}"
-            
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(
-                    check_url,
-                    headers={"Content-Type": "application/json"}
-                )
-                response_data = response.json()
+                }, 500)
+            
+            # order_id matched a stored order above, so it is plain [A-Z0-9] and needs no escaping
+            check_url = f"{_PAYTM_STATUS_URL_PREFIX}{order_id}{_PAYTM_STATUS_URL_SUFFIX}"
+            
+            response = await _paytm_client.get(check_url)
+            response_data = json_loads(response.content)
+            
+            # Polled every few seconds per open payment; %-args defer formatting to the log thread
+            logger.info("Payment status check for %s: STATUS=%s", order_id, response_data.get('STATUS'))
+            
+            status = response_data.get('STATUS', '')
+            txn_amount = response_data.get('TXNAMOUNT', '')
+            utr = response_data.get('BANKTXNID', '')
+            
+            if status == 'TXN_SUCCESS':
+                now = datetime.utcnow()
+                result = await db_session.execute(_Q_COMPLETE_SUBSCRIPTION, {
+                    'subscription_id': subscription_row.id,
+                    'utr': utr,
+                    'paid_at': now,
+                    'expires_at': now + timedelta(days=subscription_row.duration_days)
+                })
+                updated = result.first()
+                await db_session.commit()
+                
+                if not updated:
+                    # A concurrent poll recorded this payment first
+                    return fast_jsonify({
+                        'success': True,
+                        'status': 'completed',
+                        'message': 'Payment already completed'
+                    }, 200)
                 
-                logger.info(f"Payment status check for {order_id}: STATUS={response_data.get('STATUS')}")
+                logger.info("Payment successful for order %s, Amount: %s, UTR: %s", order_id, txn_amount, utr)
                 
-                status = response_data.get('STATUS', '')
-                txn_amount = response_data.get('TXNAMOUNT', '')
-                utr = response_data.get('BANKTXNID', '')
+                return fast_jsonify({
+                    'success': True,
+                    'status': 'completed',
+                    'amount': txn_amount,
+                    'utr': utr,
+                    'message': 'Payment successful!'
+                }, 200)
+            elif status == 'TXN_FAILURE':
+                result = await db_session.execute(_Q_FAIL_SUBSCRIPTION, {'subscription_id': subscription_row.id})
+                updated = result.first()
+                await db_session.commit()
                 
-                if status == 'TXN_SUCCESS':
-                    subscription.status = 'completed'
-                    subscription.utr_number = utr
-                    subscription.paid_at = datetime.utcnow()
-                    subscription.expires_at = datetime.utcnow() + timedelta(days=subscription.duration_days)
-                    
-                    await db_session.commit()
-                    
-                    logger.info(f"Payment successful for order {order_id}, Amount: {txn_amount}, UTR: {utr}")
-                    
-                    return jsonify({
+                if not updated:
+                    # Completed by a concurrent poll after the status read above; keep it completed
+                    return fast_jsonify({
                         'success': True,
                         'status': 'completed',
-                        'amount': txn_amount,
-                        'utr': utr,
-                        'message': 'Payment successful!'
-                    }), 200
-                elif status == 'TXN_FAILURE':
-                    subscription.status = 'failed'
-                    await db_session.commit()
-                    
-                    return jsonify({
-                        'success': False,
-                        'status': 'failed',
-                        'message': 'Payment failed. Please try again.'
-                    }), 200
-                else:
-                    return jsonify({
-                        'success': True,
-                        'status': 'pending',
-                        'message': 'Payment is still pending'
-                    }), 200
-                    
+                        'message': 'Payment already completed'
+                    }, 200)
+                
+                return fast_jsonify({
+                    'success': False,
+                    'status': 'failed',
+                    'message': 'Payment failed. Please try again.'
+                }, 200)
+            else:
+                return fast_jsonify({
+                    'success': True,
+                    'status': 'pending',
+                    'message': 'Payment is still pending'
+                }, 200)
+            
         except httpx.TimeoutException:
             logger.error(f"Timeout while checking payment status for {order_id}")
-            return jsonify({
+            return fast_jsonify({
                 'success': False,
                 'message': 'Payment status check timed out'
-            }), 500
+            }, 500)
         except Exception as e:
             logger.error(f"Error checking payment status: {str(e)}")
-            return jsonify({
+            return fast_jsonify({
                 'success': False,
                 'message': 'An error occurred while checking payment status'
-            }), 500
+            }, 500)
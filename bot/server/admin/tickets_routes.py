@@ -2,7 +2,6 @@ from quart import Blueprint, request, render_template, redirect
 from bot.database import AsyncSessionLocal
 from bot.models import Ticket, Publisher
 from sqlalchemy import select, func
-from datetime import datetime, timezone
 from .utils import require_admin
 from bot.server.security import csrf_protect, get_csrf_token
 
@@ -14,33 +13,27 @@ async def tickets():
     status_filter = request.args.get('status', 'all')
     
     async with AsyncSessionLocal() as db_session:
-        query = select(Ticket).order_by(Ticket.created_at.desc())
+        query = (
+            select(Ticket, Publisher)
+            .outerjoin(Publisher, Publisher.id == Ticket.publisher_id)
+            .order_by(Ticket.created_at.desc())
+        )
         
         if status_filter != 'all':
             query = query.where(Ticket.status == status_filter)
         
         result = await db_session.execute(query)
-        ticket_list = result.scalars().all()
-        
-        ticket_data = []
-        for ticket in ticket_list:
-            publisher_result = await db_session.execute(
-                select(Publisher).where(Publisher.id == ticket.publisher_id)
-            )
-            publisher = publisher_result.scalar_one_or_none()
-            
-            ticket_data.append({
-                'ticket': ticket,
-                'publisher': publisher
-            })
-        
-        open_count = await db_session.scalar(
-            select(func.count(Ticket.id)).where(Ticket.status == 'open')
-        )
+        ticket_data = [
+            {'ticket': ticket, 'publisher': publisher}
+            for ticket, publisher in result.all()
+        ]
         
-        closed_count = await db_session.scalar(
-            select(func.count(Ticket.id)).where(Ticket.status == 'closed')
+        counts_result = await db_session.execute(
+            select(Ticket.status, func.count(Ticket.id)).group_by(Ticket.status)
         )
+        status_counts = dict(counts_result.all())
+        open_count = status_counts.get('open', 0)
+        closed_count = status_counts.get('closed', 0)
         
     return await render_template('admin_tickets.html',
                                   active_page='tickets',
@@ -96,7 +89,7 @@ async def reply_ticket(ticket_id):
             
             ticket.admin_reply = admin_reply
             ticket.status = new_status
-            ticket.replied_at = datetime.now(timezone.utc)
+            ticket.replied_at = func.now()
             
             await db_session.commit()
             
@@ -1,6 +1,11 @@
-from quart import redirect, session
-import bcrypt
+from quart import redirect, session, jsonify, Response
 from functools import wraps
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 def require_admin(func):
     @wraps(func)
@@ -12,6 +17,22 @@ def require_admin(func):
         return await func(*args, **kwargs)
     return wrapper
 
-def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+def json_dumps(obj) -> str:
+    """Serialize obj to a JSON string, preferring orjson when it is installed"""
+    if orjson is None:
+        return json.dumps(obj)
+    return orjson.dumps(obj).decode('utf-8')
+
+def json_loads(data):
+    """Parse JSON from str or bytes, preferring orjson when it is installed"""
+    if orjson is None:
+        return json.loads(data)
+    return orjson.loads(data)
+
+def fast_jsonify(obj, status: int = 200) -> Response:
+    """Serialize obj to a JSON response, preferring orjson when it is installed"""
+    if orjson is None:
+        response = jsonify(obj)
+        response.status_code = status
+        return response
+    return Response(orjson.dumps(obj), status=status, content_type='application/json')
@@ -1,54 +1,305 @@
-from quart import Blueprint, request, render_template, session, jsonify
+from quart import Blueprint, request, render_template, session
 from bot.database import AsyncSessionLocal
 from bot.models import WebPublisherSubscription, WebPublisherSubscriptionPlan, Publisher, Settings
-from sqlalchemy import select, desc, or_, and_
-from .utils import require_admin
+from sqlalchemy import select, insert, update, exists, literal, case, desc, or_, and_, func, tuple_, bindparam, union
+from .utils import require_admin, fast_jsonify
 from bot.server.security import csrf_protect, get_csrf_token
-from bot.server.payment_service import generate_order_id, create_payment_links, check_paytm_status, calculate_expiry_date
+from bot.server.settings_cache import get_cached_settings, invalidate_settings_cache
+from bot.server.payment_service import generate_order_id, create_payment_links, check_paytm_status
 from logging import getLogger
 from datetime import datetime
+import asyncio
+import secrets
+import time
 
 logger = getLogger('uvicorn')
 bp = Blueprint('admin_web_subscription', __name__)
 
+WEB_SUBSCRIPTIONS_PAGE_SIZE = 50
+
+# Pre-rendered plan cards and grant <option>s, keyed by the plans version.
+# The TTL bounds staleness for plan edits made by other worker processes.
+PLAN_FRAGMENTS_TTL = 30.0
+_plans_version = 0
+_plan_fragments = {'version': None, 'html': None, 'expires': 0.0}
+# Per-process prefix so a restart (which resets _plans_version) never revalidates an old ETag
+_PLANS_ETAG_PREFIX = secrets.token_hex(4)
+
+
+def _bump_plans_version():
+    """Invalidate the pre-rendered plan fragments after a plan changes"""
+    global _plans_version
+    _plans_version += 1
+
+# Columns serialized by the JSON endpoints; selecting them skips ORM hydration
+_PLAN_JSON_COLUMNS = (
+    WebPublisherSubscriptionPlan.id,
+    WebPublisherSubscriptionPlan.name,
+    WebPublisherSubscriptionPlan.amount,
+    WebPublisherSubscriptionPlan.duration_days,
+    WebPublisherSubscriptionPlan.upload_limit,
+    WebPublisherSubscriptionPlan.max_file_size_mb,
+    WebPublisherSubscriptionPlan.description,
+    WebPublisherSubscriptionPlan.is_active
+)
+
+# Columns rendered by the web subscriptions and web payments tables
+_LIST_COLUMNS = (
+    WebPublisherSubscription.id,
+    WebPublisherSubscription.order_id,
+    Publisher.email.label('publisher_email'),
+    WebPublisherSubscription.plan_name,
+    WebPublisherSubscription.amount,
+    WebPublisherSubscription.duration_days,
+    WebPublisherSubscription.upload_limit,
+    WebPublisherSubscription.uploads_used,
+    WebPublisherSubscription.status,
+    WebPublisherSubscription.payment_method,
+    WebPublisherSubscription.utr_number,
+    WebPublisherSubscription.created_at,
+    WebPublisherSubscription.expires_at
+)
+
+_PAYMENT_SEARCH_COLUMNS = (
+    WebPublisherSubscription.id,
+    WebPublisherSubscription.order_id,
+    Publisher.email.label('publisher_email'),
+    WebPublisherSubscription.plan_name,
+    WebPublisherSubscription.amount,
+    WebPublisherSubscription.upload_limit,
+    WebPublisherSubscription.uploads_used,
+    WebPublisherSubscription.status,
+    WebPublisherSubscription.payment_method,
+    WebPublisherSubscription.utr_number,
+    WebPublisherSubscription.created_at,
+    WebPublisherSubscription.expires_at
+)
+
+# Hot statements built once; per-request values are passed as bind parameters
+_Q_ALL_PLANS = select(WebPublisherSubscriptionPlan).order_by(WebPublisherSubscriptionPlan.amount)
+_Q_ACTIVE_PLANS = _Q_ALL_PLANS.where(WebPublisherSubscriptionPlan.is_active == True)
+_Q_PLANS_JSON = select(*_PLAN_JSON_COLUMNS).order_by(WebPublisherSubscriptionPlan.amount)
+_Q_ACTIVE_PUBLISHERS = (
+    select(Publisher.id, Publisher.email)
+    .where(Publisher.is_active == True)
+    .order_by(Publisher.email)
+)
+# Only the publisher's email is shown next to a subscription, so join that column, not the entity
+_Q_SUBSCRIPTION_WITH_PUBLISHER = (
+    select(WebPublisherSubscription, Publisher.email.label('publisher_email'))
+    .outerjoin(Publisher, WebPublisherSubscription.publisher_id == Publisher.id)
+)
+_Q_SUBSCRIPTION_DETAILS = _Q_SUBSCRIPTION_WITH_PUBLISHER.where(
+    WebPublisherSubscription.id == bindparam('subscription_id')
+)
+_Q_SUBSCRIPTIONS_FIRST_PAGE = (
+    select(*_LIST_COLUMNS)
+    .outerjoin(Publisher, WebPublisherSubscription.publisher_id == Publisher.id)
+    .order_by(desc(WebPublisherSubscription.created_at), desc(WebPublisherSubscription.id))
+    .limit(WEB_SUBSCRIPTIONS_PAGE_SIZE + 1)
+)
+_Q_SUBSCRIPTIONS_AFTER_CURSOR = _Q_SUBSCRIPTIONS_FIRST_PAGE.where(
+    tuple_(WebPublisherSubscription.created_at, WebPublisherSubscription.id) < tuple_(
+        bindparam('before', type_=WebPublisherSubscription.created_at.type),
+        bindparam('before_id', type_=WebPublisherSubscription.id.type)
+    )
+)
+# Admin payment search. Each table is matched with its own indexes and the ids merged: a BitmapOr
+# cannot combine indexes across the publishers join, so a single OR over both tables is a scan
+_SEARCH_PATTERN = bindparam('pattern')
+_Q_PAYMENT_SEARCH_IDS = union(
+    select(WebPublisherSubscription.id).where(
+        or_(
+            WebPublisherSubscription.search_vector.op('@@')(func.plainto_tsquery('simple', bindparam('query'))),
+            WebPublisherSubscription.order_id.ilike(_SEARCH_PATTERN)
+        )
+    ),
+    select(WebPublisherSubscription.id)
+    .join(Publisher, WebPublisherSubscription.publisher_id == Publisher.id)
+    .where(Publisher.email.ilike(_SEARCH_PATTERN))
+)
+_Q_PAYMENT_SEARCH = (
+    select(*_PAYMENT_SEARCH_COLUMNS)
+    .outerjoin(Publisher, WebPublisherSubscription.publisher_id == Publisher.id)
+    .where(WebPublisherSubscription.id.in_(_Q_PAYMENT_SEARCH_IDS))
+    .order_by(desc(WebPublisherSubscription.created_at))
+    .limit(50)
+)
+
+# Plan limits used when the form leaves the field blank
+_DEFAULT_UPLOAD_LIMIT = 0
+_DEFAULT_MAX_FILE_SIZE_MB = 2048
+
+# (form field, caster, default when blank, validity check, error message) for add_web_plan
+_WEB_PLAN_FIELD_SPECS = (
+    ('amount', float, None, lambda v: v > 0, 'Amount must be greater than 0'),
+    ('duration_days', int, None, lambda v: v > 0, 'Duration must be greater than 0 days'),
+    ('upload_limit', int, _DEFAULT_UPLOAD_LIMIT, lambda v: v >= 0, 'Upload limit cannot be negative'),
+    ('max_file_size_mb', int, _DEFAULT_MAX_FILE_SIZE_MB, lambda v: v >= 0, 'Max file size cannot be negative')
+)
+
+# Target columns for the manual grant INSERT ... SELECT, in _grant_source() order
+_GRANT_INSERT_COLUMNS = (
+    WebPublisherSubscription.publisher_id,
+    WebPublisherSubscription.plan_id,
+    WebPublisherSubscription.plan_name,
+    WebPublisherSubscription.amount,
+    WebPublisherSubscription.duration_days,
+    WebPublisherSubscription.upload_limit,
+    WebPublisherSubscription.max_file_size_mb,
+    WebPublisherSubscription.order_id,
+    WebPublisherSubscription.uploads_used,
+    WebPublisherSubscription.status,
+    WebPublisherSubscription.payment_method,
+    WebPublisherSubscription.utr_number,
+    WebPublisherSubscription.expires_at,
+    WebPublisherSubscription.paid_at
+)
+
+
+def _grant_source(publisher_email, plan_id, order_id):
+    """SELECT producing the manual grant row from the publisher and plan it references"""
+    return select(
+        Publisher.id,
+        WebPublisherSubscriptionPlan.id,
+        WebPublisherSubscriptionPlan.name,
+        WebPublisherSubscriptionPlan.amount,
+        WebPublisherSubscriptionPlan.duration_days,
+        WebPublisherSubscriptionPlan.upload_limit,
+        WebPublisherSubscriptionPlan.max_file_size_mb,
+        literal(order_id),
+        literal(0),
+        literal('completed'),
+        literal('manual'),
+        literal('MANUAL_GRANT'),
+        func.now() + func.make_interval(0, 0, 0, WebPublisherSubscriptionPlan.duration_days),
+        func.now()
+    ).where(
+        Publisher.email == publisher_email,
+        WebPublisherSubscriptionPlan.id == plan_id
+    )
+
+
+_Q_PAYMENT_STATS = select(
+    WebPublisherSubscription.status,
+    func.count(WebPublisherSubscription.id),
+    func.coalesce(func.sum(WebPublisherSubscription.amount), 0)
+).group_by(WebPublisherSubscription.status)
+
+
+def _parse_cursor():
+    """Read the ?before=<created_at ISO timestamp>&before_id=<id> keyset cursor"""
+    try:
+        if request.args.get('before'):
+            return datetime.fromisoformat(request.args['before']), int(request.args.get('before_id', 0))
+    except ValueError:
+        pass
+    return None, None
+
+
+async def _load_subscription_rows(before=None, before_id=None):
+    """Load one page of subscription table rows with the publisher's email, newest first"""
+    if before is None:
+        query, params = _Q_SUBSCRIPTIONS_FIRST_PAGE, {}
+    else:
+        query, params = _Q_SUBSCRIPTIONS_AFTER_CURSOR, {'before': before, 'before_id': before_id}
+    
+    async with AsyncSessionLocal() as db_session:
+        result = await db_session.execute(query, params)
+        return result.all()
+
+
+def _split_page(rows):
+    """Trim the look-ahead row and return (rows, next_cursor)"""
+    if len(rows) <= WEB_SUBSCRIPTIONS_PAGE_SIZE:
+        return rows, None
+    
+    rows = rows[:WEB_SUBSCRIPTIONS_PAGE_SIZE]
+    last = rows[-1]
+    return rows, {'before': last.created_at.isoformat(), 'before_id': last.id}
+
+
+async def _load_payment_stats():
+    """Per-status counts and completed revenue across all web subscriptions"""
+    async with AsyncSessionLocal() as db_session:
+        result = await db_session.execute(_Q_PAYMENT_STATS)
+        rows = {status: (count, total) for status, count, total in result.all()}
+    
+    return {
+        'completed': rows.get('completed', (0, 0))[0],
+        'pending': rows.get('pending', (0, 0))[0],
+        'failed': rows.get('failed', (0, 0))[0],
+        'revenue': float(rows.get('completed', (0, 0))[1])
+    }
+
+
+async def _load_plans(active_only=False):
+    query = _Q_ACTIVE_PLANS if active_only else _Q_ALL_PLANS
+    
+    async with AsyncSessionLocal() as db_session:
+        result = await db_session.execute(query)
+        return result.scalars().all()
+
+
+async def _load_active_publishers():
+    async with AsyncSessionLocal() as db_session:
+        result = await db_session.execute(_Q_ACTIVE_PUBLISHERS)
+        return result.all()
+
+
+async def _render_plan_fragments():
+    """Return {'cards': ..., 'options': ...} HTML, re-rendering only after a plan change"""
+    now = time.monotonic()
+    if _plan_fragments['version'] == _plans_version and now < _plan_fragments['expires']:
+        return _plan_fragments['html']
+    
+    version = _plans_version
+    plans = await _load_plans()
+    html = {
+        'cards': await render_template('admin_web_subscriptions_plans.html', plans=plans),
+        'options': await render_template('admin_web_subscriptions_plan_options.html', plans=plans)
+    }
+    _plan_fragments.update(version=version, html=html, expires=now + PLAN_FRAGMENTS_TTL)
+    return html
+
+
+def _session_admin_user():
+    """Admin details cached in the session at login, without a Publisher lookup"""
+    publisher_id = session.get('publisher_id')
+    if not publisher_id:
+        return None
+    return session.get('admin_user') or {'id': publisher_id, 'email': session.get('publisher_email')}
+
+
+@bp.context_processor
+async def inject_csrf_token():
+    """Expose the session-bound CSRF token to this blueprint's templates"""
+    return {'csrf_token': get_csrf_token()}
+
 
 @bp.route('/web-subscriptions')
 @require_admin
 async def web_subscriptions():
     """Display admin web publisher subscriptions page"""
-    async with AsyncSessionLocal() as db_session:
-        settings_result = await db_session.execute(select(Settings))
-        settings = settings_result.scalar_one_or_none()
-        
-        web_subscriptions_enabled = settings.web_publisher_subscriptions_enabled if settings else False
-        
-        result = await db_session.execute(
-            select(WebPublisherSubscription, Publisher)
-            .outerjoin(Publisher, WebPublisherSubscription.publisher_id == Publisher.id)
-            .order_by(desc(WebPublisherSubscription.created_at))
-        )
-        subscriptions_data = result.all()
-        
-        plans_result = await db_session.execute(
-            select(WebPublisherSubscriptionPlan)
-            .order_by(WebPublisherSubscriptionPlan.amount)
-        )
-        plans = plans_result.scalars().all()
-        
-        result = await db_session.execute(
-            select(Publisher).where(Publisher.id == session['publisher_id'])
-        )
-        admin_user = result.scalar_one_or_none()
+    # Each query runs on its own session so the round-trips overlap
+    before, before_id = _parse_cursor()
+    settings, subscriptions_data, plan_fragments = await asyncio.gather(
+        get_cached_settings(),
+        _load_subscription_rows(before, before_id),
+        _render_plan_fragments()
+    )
+    subscriptions_data, next_cursor = _split_page(subscriptions_data)
+    
+    web_subscriptions_enabled = settings.web_publisher_subscriptions_enabled if settings else False
     
-    csrf_token = get_csrf_token()
     return await render_template(
         'admin_web_subscriptions.html',
         active_page='web-subscriptions',
         subscriptions_data=subscriptions_data,
-        plans=plans,
+        next_cursor=next_cursor,
+        plan_fragments=plan_fragments,
         web_subscriptions_enabled=web_subscriptions_enabled,
-        admin_user=admin_user,
-        csrf_token=csrf_token
+        admin_user=_session_admin_user()
     )
 
 
@@ -59,56 +310,54 @@ async def toggle_web_subscriptions():
     """Toggle web publisher subscriptions on/off"""
     async with AsyncSessionLocal() as db_session:
         try:
-            result = await db_session.execute(select(Settings))
-            settings = result.scalar_one_or_none()
-            
-            if not settings:
-                settings = Settings()
-                db_session.add(settings)
+            async with db_session.begin():
+                # Flip the flag in a single atomic UPDATE ... RETURNING
+                result = await db_session.execute(
+                    update(Settings)
+                    .values(web_publisher_subscriptions_enabled=~func.coalesce(Settings.web_publisher_subscriptions_enabled, False))
+                    .returning(Settings.web_publisher_subscriptions_enabled)
+                )
+                enabled = result.scalar()
+                
+                if enabled is None:
+                    db_session.add(Settings(web_publisher_subscriptions_enabled=True))
+                    enabled = True
             
-            settings.web_publisher_subscriptions_enabled = not settings.web_publisher_subscriptions_enabled
-            await db_session.commit()
+            invalidate_settings_cache()
             
-            logger.info(f"Web Publisher Subscriptions {'enabled' if settings.web_publisher_subscriptions_enabled else 'disabled'} by admin {session.get('publisher_email')}")
+            logger.info(f"Web Publisher Subscriptions {'enabled' if enabled else 'disabled'} by admin {session.get('publisher_email')}")
             
-            return jsonify({
+            return fast_jsonify({
                 'success': True,
-                'enabled': settings.web_publisher_subscriptions_enabled,
-                'message': f"Web Publisher Subscriptions {'enabled' if settings.web_publisher_subscriptions_enabled else 'disabled'} successfully"
-            }), 200
+                'enabled': enabled,
+                'message': f"Web Publisher Subscriptions {'enabled' if enabled else 'disabled'} successfully"
+            }, 200)
             
         except Exception as e:
-            await db_session.rollback()
             logger.error(f"Error toggling web subscriptions: {str(e)}")
-            return jsonify({
+            return fast_jsonify({
                 'success': False,
                 'message': 'Failed to update subscription settings'
-            }), 500
+            }, 500)
 
 
 @bp.route('/web-subscriptions/plans', methods=['GET'])
 @require_admin
 async def get_web_plans():
     """Get all web publisher subscription plans"""
+    etag = f'{_PLANS_ETAG_PREFIX}-{_plans_version}'
+    if request.if_none_match.contains(etag):
+        return '', 304, {'ETag': f'"{etag}"'}
+    
     async with AsyncSessionLocal() as db_session:
-        result = await db_session.execute(
-            select(WebPublisherSubscriptionPlan).order_by(WebPublisherSubscriptionPlan.amount)
-        )
-        plans = result.scalars().all()
+        result = await db_session.execute(_Q_PLANS_JSON)
         
-        return jsonify({
+        response = fast_jsonify({
             'success': True,
-            'plans': [{
-                'id': plan.id,
-                'name': plan.name,
-                'amount': plan.amount,
-                'duration_days': plan.duration_days,
-                'upload_limit': plan.upload_limit,
-                'max_file_size_mb': plan.max_file_size_mb,
-                'description': plan.description,
-                'is_active': plan.is_active
-            } for plan in plans]
-        }), 200
+            'plans': [dict(row._mapping) for row in result]
+        }, 200)
+    response.set_etag(etag)
+    return response
 
 
 @bp.route('/web-subscriptions/plans/add', methods=['POST'])
@@ -118,70 +367,53 @@ async def add_web_plan():
     """Add a new web publisher subscription plan"""
     data = await request.form
     name = data.get('name', '').strip()
-    amount = data.get('amount', '')
-    duration_days = data.get('duration_days', '')
-    upload_limit = data.get('upload_limit', '0')
-    max_file_size_mb = data.get('max_file_size_mb', '2048')
     description = data.get('description', '').strip()
     
-    if not name or not amount or not duration_days:
-        return jsonify({
+    if not name or not data.get('amount') or not data.get('duration_days'):
+        return fast_jsonify({
             'success': False,
             'message': 'Name, amount, and duration are required'
-        }), 400
+        }, 400)
     
+    values = {}
     try:
-        amount = float(amount)
-        duration_days = int(duration_days)
-        upload_limit = int(upload_limit) if upload_limit else 0
-        max_file_size_mb = int(max_file_size_mb) if max_file_size_mb else 2048
-        
-        if amount <= 0:
-            return jsonify({
-                'success': False,
-                'message': 'Amount must be greater than 0'
-            }), 400
-            
-        if duration_days <= 0:
-            return jsonify({
-                'success': False,
-                'message': 'Duration must be greater than 0 days'
-            }), 400
-        
-        if upload_limit < 0:
-            return jsonify({
-                'success': False,
-                'message': 'Upload limit cannot be negative'
-            }), 400
-        
-        if max_file_size_mb < 0:
-            return jsonify({
-                'success': False,
-                'message': 'Max file size cannot be negative'
-            }), 400
+        for field, cast, default, is_valid, message in _WEB_PLAN_FIELD_SPECS:
+            raw = data.get(field, '')
+            values[field] = cast(raw) if raw else default
+            if not is_valid(values[field]):
+                return fast_jsonify({
+                    'success': False,
+                    'message': message
+                }, 400)
     except ValueError:
-        return jsonify({
+        return fast_jsonify({
             'success': False,
             'message': 'Invalid amount, duration, or limit format'
-        }), 400
+        }, 400)
+    
+    amount = values['amount']
+    duration_days = values['duration_days']
+    upload_limit = values['upload_limit']
+    max_file_size_mb = values['max_file_size_mb']
     
     async with AsyncSessionLocal() as db_session:
         try:
-            plan = WebPublisherSubscriptionPlan(
-                name=name,
-                amount=amount,
-                duration_days=duration_days,
-                upload_limit=upload_limit,
-                max_file_size_mb=max_file_size_mb,
-                description=description if description else None,
-                is_active=True
-            )
-            db_session.add(plan)
-            await db_session.commit()
+            async with db_session.begin():
+                plan = WebPublisherSubscriptionPlan(
+                    name=name,
+                    amount=amount,
+                    duration_days=duration_days,
+                    upload_limit=upload_limit,
+                    max_file_size_mb=max_file_size_mb,
+                    description=description if description else None,
+                    is_active=True
+                )
+                db_session.add(plan)
+            _bump_plans_version()
             
             logger.info(f"New web subscription plan added: {name} ({duration_days} days, max size: {max_file_size_mb}MB) by admin {session.get('publisher_email')}")
             
-            return jsonify({
+            return fast_jsonify({
                 'success': True,
                 'message': 'Web subscription plan added successfully',
                 'plan': {
@@ -193,15 +425,14 @@ async def add_web_plan():
                     'max_file_size_mb': plan.max_file_size_mb,
                     'description': plan.description
                 }
-            }), 200
+            }, 200)
             
         except Exception as e:
-            await db_session.rollback()
             logger.error(f"Error adding web subscription plan: {str(e)}")
-            return jsonify({
+            return fast_jsonify({
                 'success': False,
                 'message': 'Failed to add web subscription plan'
-            }), 500
+            }, 500)
 
 
 @bp.route('/web-subscriptions/plans/<int:plan_id>/toggle', methods=['POST'])
@@ -211,35 +442,37 @@ async def toggle_web_plan(plan_id):
     """Toggle a web subscription plan active/inactive"""
     async with AsyncSessionLocal() as db_session:
         try:
-            result = await db_session.execute(
-                select(WebPublisherSubscriptionPlan).where(WebPublisherSubscriptionPlan.id == plan_id)
-            )
-            plan = result.scalar_one_or_none()
-            
-            if not plan:
-                return jsonify({
-                    'success': False,
-                    'message': 'Plan not found'
-                }), 404
+            async with db_session.begin():
+                result = await db_session.execute(
+                    update(WebPublisherSubscriptionPlan)
+                    .where(WebPublisherSubscriptionPlan.id == plan_id)
+                    .values(is_active=~func.coalesce(WebPublisherSubscriptionPlan.is_active, False))
+                    .returning(WebPublisherSubscriptionPlan.name, WebPublisherSubscriptionPlan.is_active)
+                )
+                row = result.first()
+                
+                if not row:
+                    return fast_jsonify({
+                        'success': False,
+                        'message': 'Plan not found'
+                    }, 404)
             
-            plan.is_active = not plan.is_active
-            await db_session.commit()
+            _bump_plans_version()
             
-            logger.info(f"Web subscription plan {plan.name} {'activated' if plan.is_active else 'deactivated'} by admin {session.get('publisher_email')}")
+            logger.info(f"Web subscription plan {row.name} {'activated' if row.is_active else 'deactivated'} by admin {session.get('publisher_email')}")
             
-            return jsonify({
+            return fast_jsonify({
                 'success': True,
-                'is_active': plan.is_active,
-                'message': f"Plan {'activated' if plan.is_active else 'deactivated'} successfully"
-            }), 200
+                'is_active': row.is_active,
+                'message': f"Plan {'activated' if row.is_active else 'deactivated'} successfully"
+            }, 200)
             
         except Exception as e:
-            await db_session.rollback()
             logger.error(f"Error toggling web subscription plan: {str(e)}")
-            return jsonify({
+            return fast_jsonify({
                 'success': False,
                 'message': 'Failed to toggle plan status'
-            }), 500
+            }, 500)
 
 
 @bp.route('/web-subscriptions/plans/<int:plan_id>/delete', methods=['POST'])
@@ -249,34 +482,31 @@ async def delete_web_plan(plan_id):
     """Delete a web subscription plan"""
     async with AsyncSessionLocal() as db_session:
         try:
-            result = await db_session.execute(
-                select(WebPublisherSubscriptionPlan).where(WebPublisherSubscriptionPlan.id == plan_id)
-            )
-            plan = result.scalar_one_or_none()
-            
-            if not plan:
-                return jsonify({
-                    'success': False,
-                    'message': 'Plan not found'
-                }), 404
-            
-            await db_session.delete(plan)
-            await db_session.commit()
+            async with db_session.begin():
+                plan = await db_session.get(WebPublisherSubscriptionPlan, plan_id)
+                
+                if not plan:
+                    return fast_jsonify({
+                        'success': False,
+                        'message': 'Plan not found'
+                    }, 404)
+                
+                await db_session.delete(plan)
+            _bump_plans_version()
             
             logger.info(f"Web subscription plan deleted: {plan.name} by admin {session.get('publisher_email')}")
             
-            return jsonify({
+            return fast_jsonify({
                 'success': True,
                 'message': 'Web subscription plan deleted successfully'
-            }), 200
+            }, 200)
             
         except Exception as e:
-            await db_session.rollback()
             logger.error(f"Error deleting web subscription plan: {str(e)}")
-            return jsonify({
+            return fast_jsonify({
                 'success': False,
                 'message': 'Failed to delete web subscription plan'
-            }), 500
+            }, 500)
 
 
 @bp.route('/web-subscriptions/grant', methods=['POST'])
@@ -289,77 +519,51 @@ async def grant_web_subscription():
     plan_id = data.get('plan_id', '')
     
     if not publisher_email:
-        return jsonify({
+        return fast_jsonify({
             'success': False,
             'message': 'Publisher email is required'
-        }), 400
+        }, 400)
     
     if not plan_id:
-        return jsonify({
+        return fast_jsonify({
             'success': False,
             'message': 'Plan ID is required'
-        }), 400
+        }, 400)
     
     async with AsyncSessionLocal() as db_session:
         try:
-            publisher_result = await db_session.execute(
-                select(Publisher).where(Publisher.email == publisher_email)
-            )
-            publisher = publisher_result.scalar_one_or_none()
-            
-            if not publisher:
-                return jsonify({
-                    'success': False,
-                    'message': 'Publisher not found'
-                }), 404
-            
-            plan_result = await db_session.execute(
-                select(WebPublisherSubscriptionPlan).where(WebPublisherSubscriptionPlan.id == int(plan_id))
-            )
-            plan = plan_result.scalar_one_or_none()
-            
-            if not plan:
-                return jsonify({
-                    'success': False,
-                    'message': 'Plan not found'
-                }), 404
-            
-            order_id = generate_order_id()
-            expires_at = calculate_expiry_date(plan.duration_days)
-            
-            subscription = WebPublisherSubscription(
-                publisher_id=publisher.id,
-                order_id=order_id,
-                plan_id=plan.id,
-                plan_name=plan.name,
-                amount=plan.amount,
-                duration_days=plan.duration_days,
-                upload_limit=plan.upload_limit,
-                max_file_size_mb=plan.max_file_size_mb,
-                uploads_used=0,
-                status='completed',
-                payment_method='manual',
-                utr_number='MANUAL_GRANT',
-                expires_at=expires_at,
-                paid_at=datetime.utcnow()
-            )
-            db_session.add(subscription)
-            await db_session.commit()
+            async with db_session.begin():
+                # One INSERT ... SELECT: the join yields no row when either the publisher or the plan is missing
+                order_id = generate_order_id()
+                result = await db_session.execute(
+                    insert(WebPublisherSubscription)
+                    .from_select(_GRANT_INSERT_COLUMNS, _grant_source(publisher_email, int(plan_id), order_id))
+                    .returning(WebPublisherSubscription.plan_name)
+                )
+                plan_name = result.scalar()
+                
+                if plan_name is None:
+                    publisher_exists = await db_session.scalar(
+                        select(exists().where(Publisher.email == publisher_email))
+                    )
+                    return fast_jsonify({
+                        'success': False,
+                        'message': 'Plan not found' if publisher_exists else 'Publisher not found'
+                    }, 404)
             
-            logger.info(f"Web subscription granted to {publisher_email} for plan {plan.name} by admin {session.get('publisher_email')}")
+            logger.info(f"Web subscription granted to {publisher_email} for plan {plan_name} by admin {session.get('publisher_email')}")
             
-            return jsonify({
+            return fast_jsonify({
                 'success': True,
                 'message': f'Web subscription granted to {publisher_email} successfully'
-            }), 200
+            }, 200)
             
         except Exception as e:
-            await db_session.rollback()
             logger.error(f"Error granting web subscription: {str(e)}")
-            return jsonify({
+            return fast_jsonify({
                 'success': False,
                 'message': 'Failed to grant subscription'
-            }), 500
+            }, 500)
 
 
 @bp.route('/web-subscriptions/<int:subscription_id>/extend', methods=['POST'])
@@ -371,65 +575,65 @@ async def extend_web_subscription(subscription_id):
     extend_days = data.get('extend_days', '')
     
     if not extend_days:
-        return jsonify({
+        return fast_jsonify({
             'success': False,
             'message': 'Extension days are required'
-        }), 400
+        }, 400)
     
     try:
         extend_days = int(extend_days)
         if extend_days <= 0:
-            return jsonify({
+            return fast_jsonify({
                 'success': False,
                 'message': 'Extension days must be greater than 0'
-            }), 400
+            }, 400)
     except ValueError:
-        return jsonify({
+        return fast_jsonify({
             'success': False,
             'message': 'Invalid days format'
-        }), 400
+        }, 400)
     
     async with AsyncSessionLocal() as db_session:
         try:
-            result = await db_session.execute(
-                select(WebPublisherSubscription).where(WebPublisherSubscription.id == subscription_id)
-            )
-            subscription = result.scalar_one_or_none()
-            
-            if not subscription:
-                return jsonify({
-                    'success': False,
-                    'message': 'Subscription not found'
-                }), 404
-            
-            from datetime import timedelta
-            if subscription.expires_at:
-                if subscription.expires_at > datetime.utcnow():
-                    subscription.expires_at = subscription.expires_at + timedelta(days=extend_days)
-                else:
-                    subscription.expires_at = datetime.utcnow() + timedelta(days=extend_days)
-                    subscription.status = 'completed'
-            else:
-                subscription.expires_at = datetime.utcnow() + timedelta(days=extend_days)
-            
-            subscription.duration_days += extend_days
-            await db_session.commit()
+            async with db_session.begin():
+                # Extend from the current expiry if still active, otherwise from now, in one UPDATE
+                now = func.now()
+                result = await db_session.execute(
+                    update(WebPublisherSubscription)
+                    .where(WebPublisherSubscription.id == subscription_id)
+                    .values(
+                        expires_at=func.greatest(func.coalesce(WebPublisherSubscription.expires_at, now), now)
+                        + func.make_interval(0, 0, 0, extend_days),
+                        status=case(
+                            (WebPublisherSubscription.expires_at <= now, 'completed'),
+                            else_=WebPublisherSubscription.status
+                        ),
+                        duration_days=WebPublisherSubscription.duration_days + extend_days
+                    )
+                    .returning(WebPublisherSubscription.expires_at)
+                )
+                new_expiry = result.scalar_one_or_none()
+                
+                if new_expiry is None:
+                    return fast_jsonify({
+                        'success': False,
+                        'message': 'Subscription not found'
+                    }, 404)
             
             logger.info(f"Web subscription {subscription_id} extended by {extend_days} days by admin {session.get('publisher_email')}")
             
-            return jsonify({
+            return fast_jsonify({
                 'success': True,
                 'message': f'Subscription extended by {extend_days} days successfully',
-                'new_expiry': subscription.expires_at.strftime('%Y-%m-%d') if subscription.expires_at else None
-            }), 200
+                'new_expiry': new_expiry.strftime('%Y-%m-%d')
+            }, 200)
             
         except Exception as e:
-            await db_session.rollback()
             logger.error(f"Error extending web subscription: {str(e)}")
-            return jsonify({
+            return fast_jsonify({
                 'success': False,
                 'message': 'Failed to extend subscription'
-            }), 500
+            }, 500)
 
 
 @bp.route('/web-subscriptions/<int:subscription_id>/cancel', methods=['POST'])
@@ -439,35 +643,31 @@ async def cancel_web_subscription(subscription_id):
     """Cancel/revoke a web subscription"""
     async with AsyncSessionLocal() as db_session:
         try:
-            result = await db_session.execute(
-                select(WebPublisherSubscription).where(WebPublisherSubscription.id == subscription_id)
-            )
-            subscription = result.scalar_one_or_none()
-            
-            if not subscription:
-                return jsonify({
-                    'success': False,
-                    'message': 'Subscription not found'
-                }), 404
-            
-            subscription.status = 'cancelled'
-            subscription.expires_at = datetime.utcnow()
-            await db_session.commit()
+            async with db_session.begin():
+                subscription = await db_session.get(WebPublisherSubscription, subscription_id)
+                
+                if not subscription:
+                    return fast_jsonify({
+                        'success': False,
+                        'message': 'Subscription not found'
+                    }, 404)
+                
+                subscription.status = 'cancelled'
+                subscription.expires_at = datetime.utcnow()
             
             logger.info(f"Web subscription {subscription_id} cancelled by admin {session.get('publisher_email')}")
             
-            return jsonify({
+            return fast_jsonify({
                 'success': True,
                 'message': 'Subscription cancelled successfully'
-            }), 200
+            }, 200)
             
         except Exception as e:
-            await db_session.rollback()
             logger.error(f"Error cancelling web subscription: {str(e)}")
-            return jsonify({
+            return fast_jsonify({
                 'success': False,
                 'message': 'Failed to cancel subscription'
-            }), 500
+            }, 500)
 
 
 @bp.route('/web-subscriptions/<int:subscription_id>/details', methods=['GET'])
@@ -476,26 +676,22 @@ async def get_subscription_details(subscription_id):
     """Get detailed information about a subscription"""
     async with AsyncSessionLocal() as db_session:
         try:
-            result = await db_session.execute(
-                select(WebPublisherSubscription, Publisher)
-                .outerjoin(Publisher, WebPublisherSubscription.publisher_id == Publisher.id)
-                .where(WebPublisherSubscription.id == subscription_id)
-            )
+            result = await db_session.execute(_Q_SUBSCRIPTION_DETAILS, {'subscription_id': subscription_id})
             row = result.first()
             
             if not row:
-                return jsonify({
+                return fast_jsonify({
                     'success': False,
                     'message': 'Subscription not found'
-                }), 404
+                }, 404)
             
-            subscription, publisher = row
+            subscription, publisher_email = row
             
-            return jsonify({
+            return fast_jsonify({
                 'success': True,
                 'subscription': {
                     'id': subscription.id,
-                    'publisher_email': publisher.email if publisher else 'N/A',
+                    'publisher_email': publisher_email or 'N/A',
                     'plan_name': subscription.plan_name,
                     'amount': subscription.amount,
                     'duration_days': subscription.duration_days,
@@ -507,59 +703,40 @@ async def get_subscription_details(subscription_id):
                     'created_at': subscription.created_at.strftime('%Y-%m-%d %H:%M') if subscription.created_at else None,
                     'paid_at': subscription.paid_at.strftime('%Y-%m-%d %H:%M') if subscription.paid_at else None
                 }
-            }), 200
+            }, 200)
             
         except Exception as e:
             logger.error(f"Error getting subscription details: {str(e)}")
-            return jsonify({
+            return fast_jsonify({
                 'success': False,
                 'message': 'Failed to get subscription details'
-            }), 500
+            }, 500)
 
 
 @bp.route('/web-payments')
 @require_admin
 async def web_payments():
     """Display all web subscription payment transactions"""
-    async with AsyncSessionLocal() as db_session:
-        result = await db_session.execute(
-            select(WebPublisherSubscription, Publisher)
-            .outerjoin(Publisher, WebPublisherSubscription.publisher_id == Publisher.id)
-            .order_by(desc(WebPublisherSubscription.created_at))
-        )
-        payment_data = result.all()
-        
-        plans_result = await db_session.execute(
-            select(WebPublisherSubscriptionPlan)
-            .where(WebPublisherSubscriptionPlan.is_active == True)
-            .order_by(WebPublisherSubscriptionPlan.amount)
-        )
-        plans = plans_result.scalars().all()
-        
-        publishers_result = await db_session.execute(
-            select(Publisher)
-            .where(Publisher.is_active == True)
-            .order_by(Publisher.email)
-        )
-        publishers = publishers_result.scalars().all()
-        
-        admin_user = None
-        publisher_id = session.get('publisher_id')
-        if publisher_id:
-            result = await db_session.execute(
-                select(Publisher).where(Publisher.id == publisher_id)
-            )
-            admin_user = result.scalar_one_or_none()
+    # Each query runs on its own session so the round-trips overlap
+    before, before_id = _parse_cursor()
+    payment_data, payment_stats, plans, publishers = await asyncio.gather(
+        _load_subscription_rows(before, before_id),
+        _load_payment_stats(),
+        _load_plans(active_only=True),
+        _load_active_publishers()
+    )
+    payment_data, next_cursor = _split_page(payment_data)
+    admin_user = _session_admin_user()
     
-    csrf_token = get_csrf_token()
     return await render_template(
         'admin_web_payments.html',
         active_page='web-payments',
         payment_data=payment_data,
+        payment_stats=payment_stats,
+        next_cursor=next_cursor,
         plans=plans,
         publishers=publishers,
-        admin_user=admin_user,
-        csrf_token=csrf_token
+        admin_user=admin_user
     )
 
 
@@ -567,57 +744,37 @@ async def web_payments():
 @require_admin
 @csrf_protect
 async def search_web_payments():
-    """Search web payments by Order ID or Publisher Email"""
+    """Search web payments by Order ID, UTR number or Publisher Email"""
     data = await request.json
     search_query = data.get('query', '').strip()
     
     if not search_query:
-        return jsonify({
+        return fast_jsonify({
             'success': False,
             'message': 'Search query is required'
-        }), 400
+        }, 400)
     
     async with AsyncSessionLocal() as db_session:
         try:
             result = await db_session.execute(
-                select(WebPublisherSubscription, Publisher)
-                .outerjoin(Publisher, WebPublisherSubscription.publisher_id == Publisher.id)
-                .where(
-                    or_(
-                        WebPublisherSubscription.order_id.ilike(f'%{search_query}%'),
-                        Publisher.email.ilike(f'%{search_query}%')
-                    )
-                )
-                .order_by(desc(WebPublisherSubscription.created_at))
-                .limit(50)
+                _Q_PAYMENT_SEARCH, {'query': search_query, 'pattern': f'%{search_query}%'}
             )
-            payment_data = result.all()
             
             payments = []
-            for subscription, publisher in payment_data:
-                payments.append({
-                    'id': subscription.id,
-                    'order_id': subscription.order_id,
-                    'publisher_email': publisher.email if publisher else None,
-                    'plan_name': subscription.plan_name,
-                    'amount': subscription.amount,
-                    'upload_limit': subscription.upload_limit,
-                    'uploads_used': subscription.uploads_used,
-                    'status': subscription.status,
-                    'payment_method': subscription.payment_method,
-                    'utr_number': subscription.utr_number,
-                    'created_at': subscription.created_at.strftime('%Y-%m-%d %H:%M') if subscription.created_at else None,
-                    'expires_at': subscription.expires_at.strftime('%Y-%m-%d %H:%M') if subscription.expires_at else None
-                })
+            for row in result:
+                payment = dict(row._mapping)
+                payment['created_at'] = row.created_at.strftime('%Y-%m-%d %H:%M') if row.created_at else None
+                payment['expires_at'] = row.expires_at.strftime('%Y-%m-%d %H:%M') if row.expires_at else None
+                payments.append(payment)
             
-            return jsonify({
+            return fast_jsonify({
                 'success': True,
                 'payments': payments
-            }), 200
+            }, 200)
             
         except Exception as e:
             logger.error(f"Error searching web payments: {str(e)}")
-            return jsonify({
+            return fast_jsonify({
                 'success': False,
                 'message': 'An error occurred while searching payments'
-            }), 500
+            }, 500)
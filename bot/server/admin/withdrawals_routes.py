@@ -2,71 +2,155 @@ from quart import Blueprint, request, render_template, redirect
 from bot.database import AsyncSessionLocal
 from bot.models import WithdrawalRequest, Publisher, BankAccount, Settings
 from bot.server.security import csrf_protect, get_csrf_token
-from sqlalchemy import select, func
-from datetime import datetime, timezone
+from sqlalchemy import select, update, exists, case, func, tuple_, bindparam
+from sqlalchemy.orm import raiseload
+from datetime import datetime
 from .utils import require_admin
+from bot.server.settings_cache import get_cached_settings, invalidate_settings_cache
 from bot.server.referral_helper import process_withdrawal_milestone
+import asyncio
 
 bp = Blueprint('admin_withdrawals', __name__)
 
+WITHDRAWALS_PAGE_SIZE = 50
+
+# Statements are built once at import and bound per call, so only parameters change between requests
+_PUBLISHER_EXISTS = exists().where(Publisher.id == WithdrawalRequest.publisher_id)
+_STATUS_MATCHES = WithdrawalRequest.status == bindparam('status')
+_BEFORE_CURSOR = tuple_(WithdrawalRequest.requested_at, WithdrawalRequest.id) < tuple_(
+    bindparam('before', type_=WithdrawalRequest.requested_at.type),
+    bindparam('before_id', type_=WithdrawalRequest.id.type)
+)
+
+# Publisher and bank account come from the same round trip; there are no ORM relationships to eager-load
+_Q_WITHDRAWALS_FIRST_PAGE = (
+    select(WithdrawalRequest, Publisher, BankAccount)
+    .outerjoin(Publisher, Publisher.id == WithdrawalRequest.publisher_id)
+    .outerjoin(BankAccount, BankAccount.id == WithdrawalRequest.bank_account_id)
+    .order_by(WithdrawalRequest.requested_at.desc(), WithdrawalRequest.id.desc())
+    # Any lazy load the template triggers would be an N+1; make it raise instead
+    .options(raiseload('*'))
+    # One extra row tells us whether an older page exists
+    .limit(WITHDRAWALS_PAGE_SIZE + 1)
+)
+# Keyed by (status filtered, after cursor); the cursor seeks instead of OFFSET so deep pages cost the same
+_Q_WITHDRAWALS = {
+    (False, False): _Q_WITHDRAWALS_FIRST_PAGE,
+    (True, False): _Q_WITHDRAWALS_FIRST_PAGE.where(_STATUS_MATCHES),
+    (False, True): _Q_WITHDRAWALS_FIRST_PAGE.where(_BEFORE_CURSOR),
+    (True, True): _Q_WITHDRAWALS_FIRST_PAGE.where(_STATUS_MATCHES, _BEFORE_CURSOR)
+}
+_Q_STATUS_COUNTS = (
+    select(WithdrawalRequest.status, func.count(WithdrawalRequest.id))
+    .group_by(WithdrawalRequest.status)
+)
+# The status guard makes these no-ops for anything already processed, so no SELECT is needed first
+_Q_APPROVE_WITHDRAWAL = (
+    update(WithdrawalRequest)
+    .where(WithdrawalRequest.id == bindparam('withdrawal_id'), WithdrawalRequest.status == 'pending')
+    .values(
+        status=case((_PUBLISHER_EXISTS, 'approved'), else_='rejected'),
+        admin_note=case((_PUBLISHER_EXISTS, bindparam('admin_note', type_=WithdrawalRequest.admin_note.type)), else_='Publisher not found'),
+        processed_at=func.now()
+    )
+    .returning(WithdrawalRequest.publisher_id, WithdrawalRequest.status)
+)
+# Same outcome per row as single approve: withdrawals whose publisher is gone are rejected
+_Q_BULK_APPROVE_WITHDRAWALS = (
+    update(WithdrawalRequest)
+    .where(
+        WithdrawalRequest.id.in_(bindparam('withdrawal_ids', expanding=True)),
+        WithdrawalRequest.status == 'pending'
+    )
+    .values(
+        status=case((_PUBLISHER_EXISTS, 'approved'), else_='rejected'),
+        admin_note=case((_PUBLISHER_EXISTS, WithdrawalRequest.admin_note), else_='Publisher not found'),
+        processed_at=func.now()
+    )
+    .returning(WithdrawalRequest.id, WithdrawalRequest.publisher_id, WithdrawalRequest.status)
+)
+_Q_REJECT_WITHDRAWAL = (
+    update(WithdrawalRequest)
+    .where(WithdrawalRequest.id == bindparam('withdrawal_id'), WithdrawalRequest.status == 'pending')
+    .values(status='rejected', admin_note=bindparam('admin_note'), processed_at=func.now())
+    .returning(WithdrawalRequest.publisher_id, WithdrawalRequest.amount)
+)
+_Q_RECREDIT_BALANCE = (
+    update(Publisher)
+    .where(Publisher.id == bindparam('publisher_id'))
+    .values(balance=Publisher.balance + bindparam('amount', type_=Publisher.balance.type))
+)
+
+def _parse_cursor():
+    """Read the ?before=<requested_at ISO timestamp>&before_id=<id> keyset cursor"""
+    try:
+        if request.args.get('before'):
+            return datetime.fromisoformat(request.args['before']), int(request.args.get('before_id', 0))
+    except ValueError:
+        pass
+    return None, None
+
+async def _load_withdrawals(status_filter, before=None, before_id=None):
+    """One page of withdrawal requests joined with their publisher and bank account, newest first"""
+    query = _Q_WITHDRAWALS[(status_filter != 'all', before is not None)]
+    params = {'status': status_filter, 'before': before, 'before_id': before_id}
+    
+    async with AsyncSessionLocal() as db_session:
+        result = await db_session.execute(query, params)
+        return [
+            {'withdrawal': wr, 'publisher': publisher, 'bank_account': bank_account}
+            for wr, publisher, bank_account in result
+        ]
+
+async def _load_status_counts():
+    """Withdrawal request totals keyed by status"""
+    async with AsyncSessionLocal() as db_session:
+        result = await db_session.execute(_Q_STATUS_COUNTS)
+        return dict(result.all())
+
+async def _load_settings():
+    """Settings row, creating the default one on first use"""
+    settings = await get_cached_settings()
+    if settings:
+        return settings
+    
+    async with AsyncSessionLocal() as db_session:
+        settings = Settings(minimum_withdrawal=10.0, withdrawal_enabled=True)
+        db_session.add(settings)
+        await db_session.commit()
+    
+    invalidate_settings_cache()
+    return settings
+
 @bp.route('/withdrawals')
 @require_admin
 async def withdrawals():
+    """Withdrawals list. Query budget: 2, plus 1 on a settings cache miss (tests/test_query_budgets.py)"""
     status_filter = request.args.get('status', 'all')
+    before, before_id = _parse_cursor()
     
-    async with AsyncSessionLocal() as db_session:
-        query = select(WithdrawalRequest).order_by(WithdrawalRequest.requested_at.desc())
-        
-        if status_filter != 'all':
-            query = query.where(WithdrawalRequest.status == status_filter)
-        
-        result = await db_session.execute(query)
-        withdrawal_requests = result.scalars().all()
-        
-        withdrawal_data = []
-        for wr in withdrawal_requests:
-            publisher_result = await db_session.execute(
-                select(Publisher).where(Publisher.id == wr.publisher_id)
-            )
-            publisher = publisher_result.scalar_one_or_none()
-            
-            bank_result = await db_session.execute(
-                select(BankAccount).where(BankAccount.id == wr.bank_account_id)
-            )
-            bank_account = bank_result.scalar_one_or_none()
-            
-            withdrawal_data.append({
-                'withdrawal': wr,
-                'publisher': publisher,
-                'bank_account': bank_account
-            })
-        
-        total_pending = await db_session.scalar(
-            select(func.count(WithdrawalRequest.id)).where(WithdrawalRequest.status == 'pending')
-        )
-        total_approved = await db_session.scalar(
-            select(func.count(WithdrawalRequest.id)).where(WithdrawalRequest.status == 'approved')
-        )
-        total_rejected = await db_session.scalar(
-            select(func.count(WithdrawalRequest.id)).where(WithdrawalRequest.status == 'rejected')
-        )
-        
-        settings_result = await db_session.execute(select(Settings))
-        settings = settings_result.scalar_one_or_none()
-        
-        if not settings:
-            settings = Settings(minimum_withdrawal=10.0, withdrawal_enabled=True)
-            db_session.add(settings)
-            await db_session.commit()
+    # Each query runs on its own session so the round-trips overlap
+    withdrawal_data, status_counts, settings = await asyncio.gather(
+        _load_withdrawals(status_filter, before, before_id),
+        _load_status_counts(),
+        _load_settings()
+    )
+    
+    next_cursor = None
+    if len(withdrawal_data) > WITHDRAWALS_PAGE_SIZE:
+        withdrawal_data = withdrawal_data[:WITHDRAWALS_PAGE_SIZE]
+        last = withdrawal_data[-1]['withdrawal']
+        next_cursor = {'before': last.requested_at.isoformat(), 'before_id': last.id}
     
     csrf_token = get_csrf_token()
     return await render_template('admin_withdrawals.html',
                                   active_page='withdrawals',
                                   withdrawal_data=withdrawal_data,
                                   status_filter=status_filter,
-                                  total_pending=total_pending or 0,
-                                  total_approved=total_approved or 0,
-                                  total_rejected=total_rejected or 0,
+                                  next_cursor=next_cursor,
+                                  total_pending=status_counts.get('pending', 0),
+                                  total_approved=status_counts.get('approved', 0),
+                                  total_rejected=status_counts.get('rejected', 0),
                                   minimum_withdrawal=settings.minimum_withdrawal if settings else 10.0,
                                   withdrawal_enabled=settings.withdrawal_enabled if settings else True,
                                   csrf_token=csrf_token)
@@ -87,6 +171,7 @@ async def toggle_withdrawal_requests():
                 settings.withdrawal_enabled = not settings.withdrawal_enabled
             
             await db_session.commit()
+            invalidate_settings_cache()
             status = "enabled" if settings.withdrawal_enabled else "disabled"
             return redirect(f'/admin/withdrawals?success=Withdrawal requests have been {status}')
         except Exception as e:
@@ -97,35 +182,20 @@ async def toggle_withdrawal_requests():
 @require_admin
 @csrf_protect
 async def approve_withdrawal(withdrawal_id):
+    """Approve one pending withdrawal. Query budget: 2 when the publisher was not referred"""
     data = await request.form
     admin_note = data.get('admin_note', '').strip()
     
     async with AsyncSessionLocal() as db_session:
         try:
             result = await db_session.execute(
-                select(WithdrawalRequest).where(WithdrawalRequest.id == withdrawal_id)
+                _Q_APPROVE_WITHDRAWAL, {'withdrawal_id': withdrawal_id, 'admin_note': admin_note}
             )
-            withdrawal = result.scalar_one_or_none()
+            row = result.first()
+            await db_session.commit()
             
-            if withdrawal and withdrawal.status == 'pending':
-                publisher_result = await db_session.execute(
-                    select(Publisher).where(Publisher.id == withdrawal.publisher_id)
-                )
-                publisher = publisher_result.scalar_one_or_none()
-                
-                if not publisher:
-                    withdrawal.status = 'rejected'
-                    withdrawal.admin_note = "Publisher not found"
-                    withdrawal.processed_at = datetime.now(timezone.utc)
-                    await db_session.commit()
-                else:
-                    withdrawal.status = 'approved'
-                    withdrawal.admin_note = admin_note
-                    withdrawal.processed_at = datetime.now(timezone.utc)
-                    
-                    await db_session.commit()
-                    
-                    await process_withdrawal_milestone(withdrawal.publisher_id, withdrawal_id)
+            if row and row.status == 'approved':
+                await process_withdrawal_milestone(row.publisher_id, withdrawal_id)
             
             return redirect('/admin/withdrawals')
             
@@ -133,33 +203,60 @@ async def approve_withdrawal(withdrawal_id):
             await db_session.rollback()
             return redirect('/admin/withdrawals')
 
+@bp.route('/withdrawal/bulk-approve', methods=['POST'])
+@require_admin
+@csrf_protect
+async def bulk_approve_withdrawals():
+    """Approve the selected pending withdrawals. Query budget: 1, plus 1 per approved row whose publisher was not referred"""
+    data = await request.form
+    try:
+        withdrawal_ids = [int(wid) for wid in data.getlist('withdrawal_ids')]
+    except ValueError:
+        return redirect('/admin/withdrawals?error=Invalid withdrawal selection')
+    
+    if not withdrawal_ids:
+        return redirect('/admin/withdrawals?error=No withdrawals selected')
+    
+    async with AsyncSessionLocal() as db_session:
+        try:
+            # One UPDATE for the whole selection; rows no longer pending are skipped by the guard
+            result = await db_session.execute(_Q_BULK_APPROVE_WITHDRAWALS, {'withdrawal_ids': withdrawal_ids})
+            processed = result.all()
+            await db_session.commit()
+        except Exception:
+            await db_session.rollback()
+            return redirect('/admin/withdrawals?error=Failed to approve withdrawals')
+    
+    approved = [row for row in processed if row.status == 'approved']
+    # Sequential: two withdrawals from one publisher advance the same referral counter
+    for row in approved:
+        await process_withdrawal_milestone(row.publisher_id, row.id)
+    
+    message = f'{len(approved)} withdrawal(s) approved'
+    if len(processed) > len(approved):
+        message += f', {len(processed) - len(approved)} rejected (publisher not found)'
+    return redirect(f'/admin/withdrawals?success={message}')
+
 @bp.route('/withdrawal/reject/<int:withdrawal_id>', methods=['POST'])
 @require_admin
 @csrf_protect
 async def reject_withdrawal(withdrawal_id):
+    """Reject one pending withdrawal and re-credit the publisher. Query budget: 2"""
     data = await request.form
     admin_note = data.get('admin_note', '').strip()
     
     async with AsyncSessionLocal() as db_session:
         try:
             result = await db_session.execute(
-                select(WithdrawalRequest).where(WithdrawalRequest.id == withdrawal_id)
+                _Q_REJECT_WITHDRAWAL, {'withdrawal_id': withdrawal_id, 'admin_note': admin_note}
             )
-            withdrawal = result.scalar_one_or_none()
+            row = result.first()
             
-            if withdrawal and withdrawal.status == 'pending':
-                publisher_result = await db_session.execute(
-                    select(Publisher).where(Publisher.id == withdrawal.publisher_id)
+            if row:
+                # Re-credit the balance in the same transaction
+                await db_session.execute(
+                    _Q_RECREDIT_BALANCE, {'publisher_id': row.publisher_id, 'amount': row.amount}
                 )
-                publisher = publisher_result.scalar_one_or_none()
-                
-                if publisher:
-                    publisher.balance += withdrawal.amount  # Re-credit the balance
-                
-                withdrawal.status = 'rejected'
-                withdrawal.admin_note = admin_note
-                withdrawal.processed_at = datetime.now(timezone.utc)
-                
                 await db_session.commit()
             
             return redirect('/admin/withdrawals')
@@ -192,6 +289,7 @@ async def update_minimum_withdrawal():
                 settings.minimum_withdrawal = minimum_withdrawal
             
             await db_session.commit()
+            invalidate_settings_cache()
             return redirect('/admin/withdrawals?success=Minimum withdrawal updated successfully')
             
         except (ValueError, TypeError):
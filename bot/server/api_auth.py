@@ -1,9 +1,16 @@
 from quart import request, jsonify
 from bot.database import AsyncSessionLocal
-from bot.models import ApiEndpointKey, Settings
-from sqlalchemy import select
+from bot.models import ApiEndpointKey
+from bot.server.settings_cache import get_cached_settings
+from sqlalchemy import select, exists
+from dataclasses import dataclass
 from functools import wraps
+from operator import attrgetter
 from os import environ
+from typing import Callable, Optional
+import hashlib
+import hmac
+import time
 
 ENDPOINT_TOKEN_MAPPING = {
     'Ads API': 'ads_api_token',
@@ -19,18 +26,93 @@ ENDPOINT_ENV_FALLBACK = {
     'Payment Webhook': 'PAYMENT_API_TOKEN',
 }
 
-async def validate_endpoint_api_key(endpoint_name: str) -> tuple[bool, str]:
+# Env tokens are read once at import; .env has already been loaded by bot.database
+_GLOBAL_ENV_TOKEN = environ.get('GLOBAL_API_TOKEN')
+
+# Failed key lookups allowed per client IP per window before the database is no longer consulted
+API_AUTH_MAX_FAILURES = int(environ.get("API_AUTH_MAX_FAILURES") or "30")
+API_AUTH_FAILURE_WINDOW = 60.0
+
+# peer address -> [failures, window end]; in-process, the server runs as a single process
+_auth_failures = {}
+
+# (key digest, endpoint) -> expiry for ApiEndpointKey lookups that succeeded recently, so a
+# throttled peer (e.g. a shared proxy) never has a known-good key denied
+VALID_KEY_CACHE_TTL = 30.0
+_valid_keys = {}
+
+@dataclass(frozen=True)
+class _EndpointTokenSource:
+    """Where an endpoint's dedicated token lives, resolved once per endpoint name"""
+    settings_token: Optional[Callable]
+    env_token: Optional[str]
+
+def _resolve_token_source(endpoint_name: str) -> _EndpointTokenSource:
+    token_field = ENDPOINT_TOKEN_MAPPING.get(endpoint_name)
+    return _EndpointTokenSource(
+        settings_token=attrgetter(token_field) if token_field else None,
+        env_token=environ.get(ENDPOINT_ENV_FALLBACK.get(endpoint_name, 'AD_API_TOKEN'))
+    )
+
+def _token_matches(api_key: str, token) -> bool:
+    """Constant-time comparison of a supplied key against a configured token"""
+    if not isinstance(api_key, str) or not isinstance(token, str) or not token:
+        return False
+    return hmac.compare_digest(api_key.encode(), token.encode())
+
+def api_key_digest(api_key: str) -> bytes:
+    """Digest stored in api_endpoint_keys.api_key_hash; set it wherever api_key is written"""
+    return hashlib.sha256(api_key.encode()).digest()[:16]
+
+def _throttle_key() -> str:
+    # The connecting peer, not X-Forwarded-For: a client-supplied header could dodge the
+    # throttle by rotating it, or lock out someone else by naming their IP
+    return request.remote_addr or 'unknown'
+
+def _recently_valid(cache_key: tuple) -> bool:
+    expires = _valid_keys.get(cache_key)
+    return expires is not None and expires > time.monotonic()
+
+def _remember_valid(cache_key: tuple):
+    now = time.monotonic()
+    if len(_valid_keys) > 10000:
+        for key in [key for key, end in _valid_keys.items() if end <= now]:
+            del _valid_keys[key]
+    _valid_keys[cache_key] = now + VALID_KEY_CACHE_TTL
+
+def _failures_exceeded(client_ip: str) -> bool:
+    entry = _auth_failures.get(client_ip)
+    return entry is not None and entry[1] > time.monotonic() and entry[0] >= API_AUTH_MAX_FAILURES
+
+def _record_failure(client_ip: str):
+    now = time.monotonic()
+    entry = _auth_failures.get(client_ip)
+    if entry is None or entry[1] <= now:
+        if len(_auth_failures) > 10000:
+            # Drop expired windows so guesses from many IPs cannot grow the dict without bound
+            for ip in [ip for ip, (_, end) in _auth_failures.items() if end <= now]:
+                del _auth_failures[ip]
+        _auth_failures[client_ip] = [1, now + API_AUTH_FAILURE_WINDOW]
+    else:
+        entry[0] += 1
+
+async def validate_endpoint_api_key(endpoint_name: str, source: Optional[_EndpointTokenSource] = None) -> tuple[bool, str]:
     """
     Validate API key for a specific endpoint.
     Checks multiple locations: query params, JSON body, Authorization header, X-API-Key header.
-    Priority order:
-    1. Specific token from Settings (ads_api_token, payment_api_token)
-    2. Global token from Settings (global_api_token)
-    3. ApiEndpointKey model (admin-managed keys)
-    4. Endpoint-specific env var (AD_API_TOKEN for Ads API, PAYMENT_API_TOKEN for Payment API)
-    5. Global env var (GLOBAL_API_TOKEN)
+    Accepted tokens, checked cheapest first:
+    1. Endpoint-specific env var (AD_API_TOKEN for Ads API, PAYMENT_API_TOKEN for Payment API)
+    2. Global env var (GLOBAL_API_TOKEN)
+    3. Specific token from Settings (ads_api_token, payment_api_token)
+    4. Global token from Settings (global_api_token)
+    5. ApiEndpointKey model (admin-managed keys), skipped once the connecting peer has too many recent failures
+       (keys that validated in the last VALID_KEY_CACHE_TTL seconds are still accepted)
+    `source` is the pre-resolved token lookup for the endpoint; require_endpoint_api_key passes it.
     Returns (is_valid, error_message)
     """
+    if source is None:
+        source = _resolve_token_source(endpoint_name)
+    
     api_key = request.headers.get('X-API-Key') or request.headers.get('X-Api-Key')
     
     if not api_key:
@@ -38,10 +120,14 @@ async def validate_endpoint_api_key(endpoint_name: str) -> tuple[bool, str]:
     
     if not api_key:
         try:
+            # Quart caches the parsed body on the request, so the handler's own request.json reuses it
             if request.is_json:
                 data = await request.get_json()
-                if data:
+                if isinstance(data, dict):
                     api_key = data.get('api_key') or data.get('token')
+                    if not isinstance(api_key, str):
+                        # Non-string JSON values are not keys; treat them as missing
+                        api_key = None
         except Exception:
             pass
     
@@ -53,55 +139,63 @@ async def validate_endpoint_api_key(endpoint_name: str) -> tuple[bool, str]:
     if not api_key:
         return False, 'API key is required (provide via X-API-Key header, token query param, JSON body, or Authorization header)'
     
-    async with AsyncSessionLocal() as db_session:
-        try:
-            settings_result = await db_session.execute(select(Settings))
-            settings = settings_result.scalar_one_or_none()
-            
-            if settings:
-                token_field = ENDPOINT_TOKEN_MAPPING.get(endpoint_name)
-                if token_field:
-                    specific_token = getattr(settings, token_field, None)
-                    if specific_token and api_key == specific_token:
-                        return True, ''
-                
-                if settings.global_api_token and api_key == settings.global_api_token:
-                    return True, ''
+    # Env tokens need no I/O, so a match here never touches the database
+    if _token_matches(api_key, source.env_token):
+        return True, ''
+    
+    if _token_matches(api_key, _GLOBAL_ENV_TOKEN):
+        return True, ''
+    
+    try:
+        settings = await get_cached_settings()
+        
+        if settings:
+            if source.settings_token and _token_matches(api_key, source.settings_token(settings)):
+                return True, ''
             
-            result = await db_session.execute(
-                select(ApiEndpointKey).where(
+            if _token_matches(api_key, settings.global_api_token):
+                return True, ''
+        
+        digest = api_key_digest(api_key)
+        cache_key = (digest, endpoint_name)
+        if _recently_valid(cache_key):
+            return True, ''
+        
+        # Only the ApiEndpointKey lookup costs a round trip, so that is what repeated bad keys are denied
+        client_ip = _throttle_key()
+        if _failures_exceeded(client_ip):
+            return False, 'Too many invalid API key attempts, try again later'
+        
+        async with AsyncSessionLocal() as db_session:
+            # Existence check on the digest, so the partial (api_key_hash, endpoint_name) index answers it alone
+            key_exists = await db_session.scalar(
+                select(exists().where(
+                    ApiEndpointKey.api_key_hash == digest,
                     ApiEndpointKey.endpoint_name == endpoint_name,
-                    ApiEndpointKey.api_key == api_key,
                     ApiEndpointKey.is_active == True
-                )
+                ))
             )
-            endpoint_key = result.scalar_one_or_none()
-            
-            if endpoint_key:
-                return True, ''
-            
-            env_var_name = ENDPOINT_ENV_FALLBACK.get(endpoint_name, 'AD_API_TOKEN')
-            fallback_token = environ.get(env_var_name)
-            if fallback_token and api_key == fallback_token:
-                return True, ''
-            
-            global_env_token = environ.get('GLOBAL_API_TOKEN')
-            if global_env_token and api_key == global_env_token:
-                return True, ''
-            
-            return False, 'Invalid or inactive API key'
-        except Exception as e:
-            return False, 'Error validating API key'
+        
+        if key_exists:
+            _remember_valid(cache_key)
+            return True, ''
+        
+        _record_failure(client_ip)
+        return False, 'Invalid or inactive API key'
+    except Exception as e:
+        return False, 'Error validating API key'
 
 def require_endpoint_api_key(endpoint_name: str):
     """
     Decorator to require valid API key for a specific endpoint.
     Usage: @require_endpoint_api_key('API Request')
     """
+    source = _resolve_token_source(endpoint_name)
+    
     def decorator(func):
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            is_valid, error_msg = await validate_endpoint_api_key(endpoint_name)
+            is_valid, error_msg = await validate_endpoint_api_key(endpoint_name, source)
             
             if not is_valid:
                 return jsonify({
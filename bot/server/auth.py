@@ -1,9 +1,13 @@
 from quart import Blueprint, request, render_template, redirect, session, jsonify, url_for
 from bot.database import AsyncSessionLocal
 from bot.models import Publisher, PublisherRegistration, PublisherLoginEvent, ReferralSettings
-from sqlalchemy import select
+from sqlalchemy import select, bindparam
 from datetime import datetime, timezone
+from os import environ, cpu_count
+from secrets import token_hex
+import asyncio
 import bcrypt
+import logging
 import re
 from .security import (
     csrf_protect, rate_limit, get_csrf_token,
@@ -11,12 +15,24 @@ from .security import (
     sanitize_input, validate_url
 )
 from bot.modules.geoip import get_location_from_ip
-from bot.modules.device_detection import parse_user_agent, generate_device_fingerprint, generate_hardware_fingerprint, validate_fingerprint_data
+from bot.modules.device_detection import parse_user_agent, generate_device_fingerprint, generate_hardware_fingerprint, validate_fingerprint_data, fingerprint_headers
 from .referral_helper import validate_referral_code, create_referral_relationship, create_referral_code_for_publisher
-from .encryption import get_public_key, decrypt_json
+from .encryption import get_public_key, get_x25519_public_key, decrypt_json
+from . import login_event_sink
 
 bp = Blueprint('auth', __name__)
 
+logger = logging.getLogger('bot')
+
+_Q_PUBLISHER_BY_EMAIL = select(Publisher).where(Publisher.email == bindparam('email'))
+_Q_REFERRAL_SETTINGS = select(ReferralSettings)
+
+# bcrypt cost factor for new hashes; existing hashes keep the cost they were created with
+BCRYPT_ROUNDS = int(environ.get("BCRYPT_ROUNDS") or "12")
+
+# Bounds concurrent bcrypt work so a login burst cannot take every thread in the default executor
+_bcrypt_slots = asyncio.Semaphore(cpu_count() or 4)
+
 def regenerate_session():
     """
     Regenerate session to prevent session fixation attacks.
@@ -30,13 +46,33 @@ def regenerate_session():
 def is_valid_email(email: str) -> bool:
     return validate_email_format(email)
 
-def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
+def _hash_password_sync(password: str) -> str:
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
-def verify_password(password: str, hashed: str) -> bool:
+def _verify_password_sync(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+async def hash_password(password: str) -> str:
+    """Hash a password in a worker thread so bcrypt does not block the event loop"""
+    async with _bcrypt_slots:
+        return await asyncio.to_thread(_hash_password_sync, password)
+
+async def verify_password(password: str, hashed: str) -> bool:
+    """Check a password in a worker thread so bcrypt does not block the event loop"""
+    async with _bcrypt_slots:
+        return await asyncio.to_thread(_verify_password_sync, password, hashed)
+
+# Checked against on unknown-email logins so they cost the same bcrypt time as a wrong password;
+# created on the first such login rather than at import
+_dummy_password_hash = None
+
+async def _get_dummy_password_hash() -> str:
+    global _dummy_password_hash
+    if _dummy_password_hash is None:
+        _dummy_password_hash = await hash_password(token_hex(16))
+    return _dummy_password_hash
+
 def get_client_ip() -> str:
     forwarded_for = request.headers.get('X-Forwarded-For')
     if forwarded_for:
@@ -83,8 +119,6 @@ async def register():
     
     csrf_token = get_csrf_token()
     
-    import logging
-    logger = logging.getLogger('bot')
     logger.info(f"Registration attempt - Referral code from session: {referral_code if referral_code else 'None'}")
     
     if not all([email, password, confirm_password, traffic_source]):
@@ -114,43 +148,50 @@ async def register():
     normalized_email = normalize_email(email)
     sanitized_traffic_source = sanitize_input(traffic_source, max_length=500)
     
+    # Resolved before the transaction opens so the geo lookup never holds it
+    client_ip = get_client_ip()
+    user_agent = get_user_agent()
+    country_code, country_name, region = await get_location_from_ip(client_ip)
+    
+    device_info = parse_user_agent(user_agent)
+    
+    # Collect SERVER-SIDE request headers for fingerprinting (secure, cannot be manipulated)
+    fp_headers = fingerprint_headers(request.headers)
+    
+    # Generate fingerprints using SERVER-SIDE data only
+    device_fingerprint = generate_device_fingerprint(client_ip, user_agent, fp_headers)
+    hardware_fingerprint = generate_hardware_fingerprint(user_agent, fp_headers)
+    
     async with AsyncSessionLocal() as db_session:
         try:
-            from sqlalchemy import func
-            result = await db_session.execute(
-                select(Publisher).where(func.lower(Publisher.email) == normalized_email)
-            )
+            result = await db_session.execute(_Q_PUBLISHER_BY_EMAIL, {'email': normalized_email})
             existing = result.scalar_one_or_none()
             
             if existing:
                 return await render_template('register.html', error='Email already registered', csrf_token=csrf_token)
             
-            password_hash = hash_password(password)
+            password_hash = await hash_password(password)
+            
+            # Welcome bonus only applies to signups without a referral code; fold it into the INSERT
+            welcome_bonus = 0.0
+            if not referral_code:
+                settings_result = await db_session.execute(_Q_REFERRAL_SETTINGS)
+                settings = settings_result.scalar_one_or_none()
+                if settings and settings.new_publisher_welcome_bonus_enabled and settings.new_publisher_welcome_bonus_amount > 0:
+                    welcome_bonus = settings.new_publisher_welcome_bonus_amount
             
             publisher = Publisher(
                 email=normalized_email,
                 password_hash=password_hash,
                 traffic_source=sanitized_traffic_source,
                 is_admin=False,
-                is_active=True
+                is_active=True,
+                balance=welcome_bonus
             )
             
             db_session.add(publisher)
-            await db_session.commit()
-            await db_session.refresh(publisher)
-            
-            client_ip = get_client_ip()
-            user_agent = get_user_agent()
-            country_code, country_name, region = await get_location_from_ip(client_ip)
-            
-            device_info = parse_user_agent(user_agent)
-            
-            # Collect SERVER-SIDE request headers for fingerprinting (secure, cannot be manipulated)
-            request_headers = dict(request.headers)
-            
-            # Generate fingerprints using SERVER-SIDE data only
-            device_fingerprint = generate_device_fingerprint(client_ip, user_agent, request_headers)
-            hardware_fingerprint = generate_hardware_fingerprint(user_agent, request_headers)
+            # Flush for publisher.id; the registration log goes out in the same commit
+            await db_session.flush()
             
             registration_log = PublisherRegistration(
                 publisher_id=publisher.id,
@@ -171,25 +212,17 @@ async def register():
             db_session.add(registration_log)
             await db_session.commit()
             
+            if welcome_bonus:
+                logger.info(f"Credited welcome bonus of ${welcome_bonus} to new publisher {publisher.id} (no referral code)")
+            
             await create_referral_code_for_publisher(publisher.id)
             
             if referral_code:
-                logger.info(f"Processing referral code: {referral_code}")
-                code_valid, referrer_id = await validate_referral_code(referral_code)
-                logger.info(f"Referral code validation result: valid={code_valid}, referrer_id={referrer_id}")
-                if code_valid and referrer_id:
+                # Validated before the publisher was created; reuse that result instead of querying again
+                logger.info(f"Processing referral code: {referral_code}, referrer_id={referrer_id}")
+                if referrer_id:
                     result = await create_referral_relationship(referrer_id, publisher.id, referral_code)
                     logger.info(f"Referral relationship created: {result}")
-                else:
-                    logger.warning(f"Referral code {referral_code} failed validation on second check")
-            else:
-                settings_result = await db_session.execute(select(ReferralSettings))
-                settings = settings_result.scalar_one_or_none()
-                
-                if settings and settings.new_publisher_welcome_bonus_enabled and settings.new_publisher_welcome_bonus_amount > 0:
-                    publisher.balance += settings.new_publisher_welcome_bonus_amount
-                    await db_session.commit()
-                    logger.info(f"Credited welcome bonus of ${settings.new_publisher_welcome_bonus_amount} to new publisher {publisher.id} (no referral code)")
             
             if 'pending_referral_code' in session:
                 del session['pending_referral_code']
@@ -218,8 +251,9 @@ async def login_page():
     csrf_token = get_csrf_token()
     
     public_key = get_public_key()
+    x25519_public_key = get_x25519_public_key()
     
-    return await render_template('login.html', csrf_token=csrf_token, public_key=public_key)
+    return await render_template('login.html', csrf_token=csrf_token, public_key=public_key, x25519_public_key=x25519_public_key)
 
 @bp.route('/login', methods=['POST'])
 @csrf_protect
@@ -230,22 +264,22 @@ async def login():
     
     csrf_token = get_csrf_token()
     public_key = get_public_key()
+    x25519_public_key = get_x25519_public_key()
     
     if not encrypted_data:
-        return await render_template('login.html', error='Encrypted data required. Please enable JavaScript.', csrf_token=csrf_token, public_key=public_key)
+        return await render_template('login.html', error='Encrypted data required. Please enable JavaScript.', csrf_token=csrf_token, public_key=public_key, x25519_public_key=x25519_public_key)
     
     try:
-        decrypted = decrypt_json(encrypted_data)
+        # The RSA private-key operation is CPU-bound; keep it off the event loop
+        decrypted = await asyncio.to_thread(decrypt_json, encrypted_data)
         email = decrypted.get('email', '').strip()
         password = decrypted.get('password', '')
     except Exception as e:
-        import logging
-        logger = logging.getLogger('bot')
         logger.error(f"Decryption failed: {str(e)}")
-        return await render_template('login.html', error='Invalid encrypted data. Please refresh and try again.', csrf_token=csrf_token, public_key=public_key)
+        return await render_template('login.html', error='Invalid encrypted data. Please refresh and try again.', csrf_token=csrf_token, public_key=public_key, x25519_public_key=x25519_public_key)
     
     if not email or not password:
-        return await render_template('login.html', error='Email and password are required', csrf_token=csrf_token, public_key=public_key)
+        return await render_template('login.html', error='Email and password are required', csrf_token=csrf_token, public_key=public_key, x25519_public_key=x25519_public_key)
     
     normalized_email = normalize_email(email)
     
@@ -256,110 +290,51 @@ async def login():
     device_info = parse_user_agent(user_agent)
     
     # Collect SERVER-SIDE request headers for fingerprinting (secure, cannot be manipulated)
-    import logging
-    logger = logging.getLogger('bot')
-    request_headers = dict(request.headers)
+    fp_headers = fingerprint_headers(request.headers)
     
     # Generate fingerprints using SERVER-SIDE data only
-    device_fingerprint = generate_device_fingerprint(client_ip, user_agent, request_headers)
-    hardware_fingerprint = generate_hardware_fingerprint(user_agent, request_headers)
+    device_fingerprint = generate_device_fingerprint(client_ip, user_agent, fp_headers)
+    hardware_fingerprint = generate_hardware_fingerprint(user_agent, fp_headers)
+    
+    event_fields = dict(
+        email=normalized_email,
+        ip_address=client_ip,
+        user_agent=user_agent,
+        country_code=country_code,
+        country_name=country_name,
+        device_fingerprint=device_fingerprint,
+        hardware_fingerprint=hardware_fingerprint,
+        device_type=device_info.get('device_type'),
+        device_name=device_info.get('device_name'),
+        operating_system=device_info.get('operating_system'),
+        browser_name=device_info.get('browser_name'),
+        browser_version=device_info.get('browser_version')
+    )
     
     async with AsyncSessionLocal() as db_session:
         try:
-            from sqlalchemy import func
-            result = await db_session.execute(
-                select(Publisher).where(func.lower(Publisher.email) == normalized_email)
-            )
+            result = await db_session.execute(_Q_PUBLISHER_BY_EMAIL, {'email': normalized_email})
             publisher = result.scalar_one_or_none()
             
             if not publisher:
-                login_event = PublisherLoginEvent(
-                    publisher_id=None,
-                    email=normalized_email,
-                    success=False,
-                    failure_reason='Invalid credentials',
-                    ip_address=client_ip,
-                    user_agent=user_agent,
-                    country_code=country_code,
-                    country_name=country_name,
-                    device_fingerprint=device_fingerprint,
-                    hardware_fingerprint=hardware_fingerprint,
-                    device_type=device_info.get('device_type'),
-                    device_name=device_info.get('device_name'),
-                    operating_system=device_info.get('operating_system'),
-                    browser_name=device_info.get('browser_name'),
-                    browser_version=device_info.get('browser_version')
-                )
-                db_session.add(login_event)
-                await db_session.commit()
-                return await render_template('login.html', error='Invalid email or password', csrf_token=csrf_token, public_key=public_key)
+                await verify_password(password, await _get_dummy_password_hash())
+                login_event_sink.enqueue(dict(publisher_id=None, success=False, failure_reason='Invalid credentials', **event_fields))
+                return await render_template('login.html', error='Invalid email or password', csrf_token=csrf_token, public_key=public_key, x25519_public_key=x25519_public_key)
             
             if not publisher.is_active:
-                login_event = PublisherLoginEvent(
-                    publisher_id=publisher.id,
-                    email=normalized_email,
-                    success=False,
-                    failure_reason='Account disabled',
-                    ip_address=client_ip,
-                    user_agent=user_agent,
-                    country_code=country_code,
-                    country_name=country_name,
-                    device_fingerprint=device_fingerprint,
-                    hardware_fingerprint=hardware_fingerprint,
-                    device_type=device_info.get('device_type'),
-                    device_name=device_info.get('device_name'),
-                    operating_system=device_info.get('operating_system'),
-                    browser_name=device_info.get('browser_name'),
-                    browser_version=device_info.get('browser_version')
-                )
-                db_session.add(login_event)
-                await db_session.commit()
-                return await render_template('login.html', error='Account is disabled. Please contact support.', csrf_token=csrf_token, public_key=public_key)
+                login_event_sink.enqueue(dict(publisher_id=publisher.id, success=False, failure_reason='Account disabled', **event_fields))
+                return await render_template('login.html', error='Account is disabled. Please contact support.', csrf_token=csrf_token, public_key=public_key, x25519_public_key=x25519_public_key)
             
-            if not verify_password(password, publisher.password_hash):
-                login_event = PublisherLoginEvent(
-                    publisher_id=publisher.id,
-                    email=normalized_email,
-                    success=False,
-                    failure_reason='Invalid password',
-                    ip_address=client_ip,
-                    user_agent=user_agent,
-                    country_code=country_code,
-                    country_name=country_name,
-                    device_fingerprint=device_fingerprint,
-                    hardware_fingerprint=hardware_fingerprint,
-                    device_type=device_info.get('device_type'),
-                    device_name=device_info.get('device_name'),
-                    operating_system=device_info.get('operating_system'),
-                    browser_name=device_info.get('browser_name'),
-                    browser_version=device_info.get('browser_version')
-                )
-                db_session.add(login_event)
-                await db_session.commit()
-                return await render_template('login.html', error='Invalid email or password', csrf_token=csrf_token, public_key=public_key)
+            if not await verify_password(password, publisher.password_hash):
+                login_event_sink.enqueue(dict(publisher_id=publisher.id, success=False, failure_reason='Invalid password', **event_fields))
+                return await render_template('login.html', error='Invalid email or password', csrf_token=csrf_token, public_key=public_key, x25519_public_key=x25519_public_key)
             
             publisher.last_login = datetime.now(timezone.utc)
             publisher.last_login_ip = client_ip
             publisher.last_login_geo = f"{country_name} ({country_code})" if country_name else None
             
-            login_event = PublisherLoginEvent(
-                publisher_id=publisher.id,
-                email=normalized_email,
-                success=True,
-                failure_reason=None,
-                ip_address=client_ip,
-                user_agent=user_agent,
-                country_code=country_code,
-                country_name=country_name,
-                device_fingerprint=device_fingerprint,
-                hardware_fingerprint=hardware_fingerprint,
-                device_type=device_info.get('device_type'),
-                device_name=device_info.get('device_name'),
-                operating_system=device_info.get('operating_system'),
-                browser_name=device_info.get('browser_name'),
-                browser_version=device_info.get('browser_version')
-            )
-            db_session.add(login_event)
+            # Successful logins are written synchronously so they commit atomically with last_login
+            db_session.add(PublisherLoginEvent(publisher_id=publisher.id, success=True, failure_reason=None, **event_fields))
             await db_session.commit()
             
             regenerate_session()
@@ -367,6 +342,8 @@ async def login():
             session['publisher_id'] = publisher.id
             session['publisher_email'] = publisher.email
             session['is_admin'] = publisher.is_admin
+            if publisher.is_admin:
+                session['admin_user'] = {'id': publisher.id, 'email': publisher.email}
             session.permanent = True
             
             if publisher.is_admin:
@@ -376,7 +353,7 @@ async def login():
             
         except Exception as e:
             await db_session.rollback()
-            return await render_template('login.html', error='Login failed. Please try again.', csrf_token=csrf_token, public_key=public_key)
+            return await render_template('login.html', error='Login failed. Please try again.', csrf_token=csrf_token, public_key=public_key, x25519_public_key=x25519_public_key)
 
 @bp.route('/logout')
 async def logout():
@@ -1,25 +1,66 @@
 import logging
 import hashlib
-from datetime import datetime, timezone
+import struct
+from datetime import date, datetime, timezone
+from functools import lru_cache
 from dateutil.relativedelta import relativedelta
-from sqlalchemy import select, func, and_, extract, text
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import select, extract, text, bindparam
 from bot.database import AsyncSessionLocal
-from bot.models import PremiumLinkEarning, SubscriptionPlan, Publisher, File, Subscription
+from bot.models import SubscriptionPlan, File, Subscription
 
 logger = logging.getLogger(__name__)
 
+# Two big-endian signed int4s, matching pg_advisory_xact_lock(int4, int4)
+_LOCK_ID = struct.Struct('>ii')
+
 def get_monthly_limit_lock_id(android_id: str, plan_id: int) -> tuple[int, int]:
     """
     Generate a unique lock ID pair for monthly limit enforcement per (android_id, plan_id).
     Uses hashlib to create a stable 64-bit key from the combination.
     Returns (key1, key2) for use with pg_advisory_xact_lock(key1, key2).
     """
-    combined = f"{android_id}:{plan_id}"
-    hash_bytes = hashlib.sha256(combined.encode()).digest()
-    key1 = int.from_bytes(hash_bytes[:4], byteorder='big', signed=False)
-    key2 = int.from_bytes(hash_bytes[4:8], byteorder='big', signed=False)
-    return (key1, key2)
+    return _LOCK_ID.unpack_from(hashlib.sha256(f"{android_id}:{plan_id}".encode()).digest())
+
+@lru_cache(maxsize=4)
+def _month_bounds(year: int, month: int) -> tuple[date, date]:
+    """Return (first day of the month, first day of the next month)"""
+    return date(year, month, 1), date(year + (month == 12), month % 12 + 1, 1)
+
+_Q_ACTIVE_PLAN = select(SubscriptionPlan).where(
+    SubscriptionPlan.id == bindparam('plan_id'),
+    SubscriptionPlan.is_active == True
+)
+
+_Q_MONTHLY_LIMIT_LOCK = text("SELECT pg_advisory_xact_lock(:key1, :key2)")
+
+# Inserts the earning only while the device is under its monthly limit for the plan and the
+# publisher is active, skips daily duplicates, and credits the balance in the same statement.
+# Returns the new balance, or no row when nothing was earned.
+_Q_RECORD_EARNING = text("""
+    WITH inserted AS (
+        INSERT INTO premium_link_earnings
+            (publisher_id, android_id, hash_id, plan_id, subscription_id, earning_amount, earning_date)
+        SELECT p.id, CAST(:android_id AS varchar), CAST(:hash_id AS varchar), CAST(:plan_id AS integer),
+               CAST(:subscription_id AS integer), CAST(:amount AS double precision), CAST(:earning_date AS date)
+        FROM publishers p
+        WHERE p.id = :publisher_id
+          AND p.is_active
+          AND (
+              SELECT count(*) FROM premium_link_earnings e
+              WHERE e.android_id = :android_id
+                AND e.plan_id = :plan_id
+                AND e.earning_date >= :month_start
+                AND e.earning_date < :month_end
+          ) < :monthly_limit
+        ON CONFLICT (publisher_id, android_id, hash_id, earning_date) DO NOTHING
+        RETURNING publisher_id, earning_amount
+    )
+    UPDATE publishers
+    SET balance = publishers.balance + inserted.earning_amount
+    FROM inserted
+    WHERE publishers.id = inserted.publisher_id
+    RETURNING publishers.balance
+""")
 
 async def process_premium_link_earning(
     subscription_id: int,
@@ -58,12 +99,7 @@ async def process_premium_link_earning(
         
         async with AsyncSessionLocal() as earning_session:
             async with earning_session.begin():
-                plan_result = await earning_session.execute(
-                    select(SubscriptionPlan).where(
-                        SubscriptionPlan.id == plan_id,
-                        SubscriptionPlan.is_active == True
-                    )
-                )
+                plan_result = await earning_session.execute(_Q_ACTIVE_PLAN, {'plan_id': plan_id})
                 plan = plan_result.scalar_one_or_none()
                 
                 if not plan:
@@ -78,86 +114,45 @@ async def process_premium_link_earning(
                     logger.debug(f"Plan {plan.name} has no monthly_link_limit, skipping")
                     return
                 
+                # Serializes earners for one (android_id, plan) so the monthly count below cannot race
                 key1, key2 = get_monthly_limit_lock_id(android_id, plan.id)
-                await earning_session.execute(text(f"SELECT pg_advisory_xact_lock({key1}, {key2})"))
+                await earning_session.execute(_Q_MONTHLY_LIMIT_LOCK, {'key1': key1, 'key2': key2})
                 logger.debug(f"Acquired advisory lock ({key1}, {key2}) for android_id {android_id}, plan_id {plan.id}")
                 
                 now = datetime.now(timezone.utc)
                 current_date = now.date()
+                first_day_of_month, first_day_of_next_month = _month_bounds(now.year, now.month)
                 
-                first_day_of_month = current_date.replace(day=1)
-                if current_date.month == 12:
-                    first_day_of_next_month = current_date.replace(year=current_date.year + 1, month=1, day=1)
-                else:
-                    first_day_of_next_month = current_date.replace(month=current_date.month + 1, day=1)
-                
-                month_count_result = await earning_session.execute(
-                    select(func.count(PremiumLinkEarning.id)).where(
-                        and_(
-                            PremiumLinkEarning.android_id == android_id,
-                            PremiumLinkEarning.plan_id == plan.id,
-                            PremiumLinkEarning.earning_date >= first_day_of_month,
-                            PremiumLinkEarning.earning_date < first_day_of_next_month
-                        )
-                    )
+                result = await earning_session.execute(
+                    _Q_RECORD_EARNING,
+                    {
+                        'publisher_id': publisher_id,
+                        'android_id': android_id,
+                        'hash_id': hash_id,
+                        'plan_id': plan.id,
+                        'subscription_id': subscription_id,
+                        'amount': plan.earning_per_link,
+                        'earning_date': current_date,
+                        'month_start': first_day_of_month,
+                        'month_end': first_day_of_next_month,
+                        'monthly_limit': plan.monthly_link_limit
+                    }
                 )
-                month_count = month_count_result.scalar() or 0
+                new_balance = result.scalar_one_or_none()
                 
-                if month_count >= plan.monthly_link_limit:
-                    logger.info(
-                        f"Monthly limit reached for android_id {android_id}, "
-                        f"plan {plan.name}: {month_count}/{plan.monthly_link_limit}"
+                if new_balance is None:
+                    logger.debug(
+                        f"No earning recorded for publisher {publisher_id}, android_id {android_id}, "
+                        f"hash_id {hash_id}, plan {plan.name}: monthly limit reached, already earned today, "
+                        f"or publisher missing/inactive"
                     )
                     return
                 
-                publisher_result = await earning_session.execute(
-                    select(Publisher)
-                    .where(Publisher.id == publisher_id)
-                    .with_for_update()
+                logger.info(
+                    f"Earning created: Publisher {publisher_id} earned {plan.earning_per_link} "
+                    f"from android_id {android_id}, hash_id {hash_id}, plan {plan.name}. "
+                    f"New balance: {new_balance}"
                 )
-                publisher = publisher_result.scalar_one_or_none()
-                
-                if not publisher:
-                    logger.warning(f"Publisher {publisher_id} not found")
-                    return
-                
-                if not publisher.is_active:
-                    logger.info(f"Publisher {publisher.id} is inactive, skipping earning")
-                    return
-                
-                earning = PremiumLinkEarning(
-                    publisher_id=publisher.id,
-                    android_id=android_id,
-                    hash_id=hash_id,
-                    plan_id=plan.id,
-                    subscription_id=subscription_id,
-                    earning_amount=plan.earning_per_link,
-                    earning_date=current_date
-                )
-                
-                try:
-                    earning_session.add(earning)
-                    
-                    publisher.balance += plan.earning_per_link
-                    
-                    await earning_session.flush()
-                    
-                    logger.info(
-                        f"Earning created: Publisher {publisher.id} earned {plan.earning_per_link} "
-                        f"from android_id {android_id}, hash_id {hash_id}, plan {plan.name}. "
-                        f"New balance: {publisher.balance}"
-                    )
-                    
-                except IntegrityError as e:
-                    if 'uq_earning_daily' in str(e):
-                        logger.debug(
-                            f"Daily earning already recorded for publisher {publisher.id}, "
-                            f"android_id {android_id}, hash_id {hash_id} on {current_date}"
-                        )
-                    else:
-                        logger.exception(f"Integrity error creating earning: {e}")
-                    await earning_session.rollback()
-                    return
                 
     except Exception as e:
         logger.exception(f"Error processing premium link earning: {e}")
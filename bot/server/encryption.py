@@ -1,12 +1,32 @@
-"""End-to-end encryption utilities using RSA public-key cryptography"""
+"""End-to-end encryption utilities using RSA and X25519 public-key cryptography"""
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.backends import default_backend
 import base64
+import binascii
 import json
 import os
+import threading
 from typing import Dict, Any, Tuple
 
+# Hybrid payloads carry a 12-byte AES-GCM nonce after the RSA-wrapped key
+AES_GCM_NONCE_SIZE = 12
+
+# ECIES payloads are tagged so they cannot be confused with the RSA formats
+ECIES_PREFIX = 'x25519:'
+ECIES_HKDF_INFO = b'login'
+X25519_KEY_SIZE = 32
+
+
+def _b64decode(encrypted_data: str) -> bytes:
+    try:
+        return binascii.a2b_base64(encrypted_data)
+    except binascii.Error as e:
+        raise ValueError(f"Decryption failed: {str(e)}")
+
 
 class EncryptionManager:
     """Manages RSA public-key encryption for secure credential transmission"""
@@ -29,6 +49,23 @@ class EncryptionManager:
             )
         
         self.public_key = self.private_key.public_key()
+        # The key pair never changes, so serialize the public half once
+        self._public_key_pem = self.public_key.public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode('utf-8')
+        
+        env_x25519_key = os.environ.get('X25519_PRIVATE_KEY')
+        if env_x25519_key:
+            self.x25519_private_key = X25519PrivateKey.from_private_bytes(base64.b64decode(env_x25519_key))
+        else:
+            self.x25519_private_key = X25519PrivateKey.generate()
+        self._x25519_public_key_b64 = base64.b64encode(
+            self.x25519_private_key.public_key().public_bytes(
+                encoding=serialization.Encoding.Raw,
+                format=serialization.PublicFormat.Raw
+            )
+        ).decode('ascii')
     
     def get_public_key_pem(self) -> str:
         """
@@ -37,18 +74,23 @@ class EncryptionManager:
         Returns:
             Base64-encoded public key in PEM format
         """
-        pem = self.public_key.public_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PublicFormat.SubjectPublicKeyInfo
-        )
-        return pem.decode('utf-8')
+        return self._public_key_pem
+    
+    def get_x25519_public_key(self) -> str:
+        """
+        Get the raw X25519 public key for client-side ECIES encryption
+        
+        Returns:
+            Base64 of the 32-byte public key
+        """
+        return self._x25519_public_key_b64
     
-    def decrypt_data(self, encrypted_data: str) -> str:
+    def decrypt_data(self, ciphertext: bytes) -> str:
         """
         Decrypt data using RSA private key with OAEP padding
         
         Args:
-            encrypted_data: Base64-encoded encrypted data
+            ciphertext: Raw RSA-OAEP ciphertext
         
         Returns:
             Decrypted plain text data
@@ -57,8 +99,6 @@ class EncryptionManager:
             ValueError: If decryption fails
         """
         try:
-            ciphertext = base64.b64decode(encrypted_data)
-            
             plaintext = self.private_key.decrypt(
                 ciphertext,
                 padding.OAEP(
@@ -72,6 +112,74 @@ class EncryptionManager:
         except Exception as e:
             raise ValueError(f"Decryption failed: {str(e)}")
     
+    def decrypt_data_b64(self, encrypted_data: str) -> str:
+        """Decrypt base64-encoded RSA-OAEP data"""
+        return self.decrypt_data(_b64decode(encrypted_data))
+    
+    def decrypt_hybrid(self, blob: bytes) -> str:
+        """
+        Decrypt a hybrid RSA-OAEP + AES-256-GCM payload
+        
+        Args:
+            blob: RSA-wrapped AES key || 12-byte nonce || AES-GCM ciphertext and tag
+        
+        Returns:
+            Decrypted plain text data
+        
+        Raises:
+            ValueError: If decryption fails
+        """
+        try:
+            blob = memoryview(blob)
+            key_size = self.private_key.key_size // 8
+            wrapped_key = bytes(blob[:key_size])
+            nonce = blob[key_size:key_size + AES_GCM_NONCE_SIZE]
+            ciphertext = blob[key_size + AES_GCM_NONCE_SIZE:]
+            
+            aes_key = self.private_key.decrypt(
+                wrapped_key,
+                padding.OAEP(
+                    mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                    algorithm=hashes.SHA256(),
+                    label=None
+                )
+            )
+            
+            return AESGCM(aes_key).decrypt(nonce, ciphertext, None).decode('utf-8')
+        except Exception as e:
+            raise ValueError(f"Decryption failed: {str(e)}")
+    
+    def decrypt_ecies(self, blob: bytes) -> str:
+        """
+        Decrypt an X25519 ECDH + HKDF-SHA256 + AES-256-GCM payload
+        
+        Args:
+            blob: Ephemeral public key || 12-byte nonce || AES-GCM ciphertext and tag
+        
+        Returns:
+            Decrypted plain text data
+        
+        Raises:
+            ValueError: If decryption fails
+        """
+        try:
+            blob = memoryview(blob)
+            peer_key = X25519PublicKey.from_public_bytes(bytes(blob[:X25519_KEY_SIZE]))
+            nonce = blob[X25519_KEY_SIZE:X25519_KEY_SIZE + AES_GCM_NONCE_SIZE]
+            ciphertext = blob[X25519_KEY_SIZE + AES_GCM_NONCE_SIZE:]
+            
+            shared_secret = self.x25519_private_key.exchange(peer_key)
+            aes_key = HKDF(
+                algorithm=hashes.SHA256(),
+                length=32,
+                salt=None,
+                info=ECIES_HKDF_INFO
+            ).derive(shared_secret)
+            
+            return AESGCM(aes_key).decrypt(nonce, ciphertext, None).decode('utf-8')
+        except Exception as e:
+            raise ValueError(f"Decryption failed: {str(e)}")
+    
     def decrypt_json(self, encrypted_data: str) -> Dict[str, Any]:
         """
         Decrypt and parse JSON data
@@ -82,24 +190,52 @@ class EncryptionManager:
         Returns:
             Parsed JSON data as dictionary
         """
-        decrypted_text = self.decrypt_data(encrypted_data)
+        # Base64 is decoded once here; the decrypt methods work on the raw bytes
+        if encrypted_data.startswith(ECIES_PREFIX):
+            return json.loads(self.decrypt_ecies(_b64decode(encrypted_data[len(ECIES_PREFIX):])))
+        
+        blob = _b64decode(encrypted_data)
+        # A bare RSA block is exactly one key length; anything longer is the hybrid format.
+        # Pages rendered before the switch still post the bare form.
+        if len(blob) > self.private_key.key_size // 8:
+            decrypted_text = self.decrypt_hybrid(blob)
+        else:
+            decrypted_text = self.decrypt_data(blob)
         return json.loads(decrypted_text)
 
 
-# Global encryption manager instance
-encryption_manager = EncryptionManager()
+# Global encryption manager instance; importing this module does not pay for key generation,
+# the server builds it off-loop in before_serving and other callers create it on first use
+_encryption_manager = None
+# decrypt_json runs in worker threads, so first use can race between threads
+_encryption_manager_lock = threading.Lock()
+
+
+def get_encryption_manager() -> EncryptionManager:
+    """Return the process-wide EncryptionManager, creating it on first call"""
+    global _encryption_manager
+    if _encryption_manager is None:
+        with _encryption_manager_lock:
+            if _encryption_manager is None:
+                _encryption_manager = EncryptionManager()
+    return _encryption_manager
 
 
 def get_public_key() -> str:
     """Get the public key for client-side encryption"""
-    return encryption_manager.get_public_key_pem()
+    return get_encryption_manager().get_public_key_pem()
+
+
+def get_x25519_public_key() -> str:
+    """Get the X25519 public key for client-side ECIES encryption"""
+    return get_encryption_manager().get_x25519_public_key()
 
 
 def decrypt(encrypted_data: str) -> str:
     """Decrypt data with the server's private key"""
-    return encryption_manager.decrypt_data(encrypted_data)
+    return get_encryption_manager().decrypt_data_b64(encrypted_data)
 
 
 def decrypt_json(encrypted_data: str) -> Dict[str, Any]:
     """Decrypt and parse JSON data"""
-    return encryption_manager.decrypt_json(encrypted_data)
+    return get_encryption_manager().decrypt_json(encrypted_data)
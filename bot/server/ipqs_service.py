@@ -2,53 +2,219 @@ import aiohttp
 import asyncio
 from logging import getLogger
 from typing import Optional, Dict, Any
-from dataclasses import dataclass
-from datetime import datetime, timezone
+from dataclasses import dataclass, field, replace
+from collections import OrderedDict
+import time
+import json
+import ipaddress
+from functools import lru_cache
+from sqlalchemy import select, update, func, bindparam, Integer
+from bot.database import AsyncSessionLocal
+from bot.models import IPQSApiKey
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = getLogger('uvicorn')
 
+# Parses the raw body directly, skipping aiohttp's content-type check and stdlib decoder when orjson is present
+_json_loads = orjson.loads if orjson else json.loads
+
 IPQS_PROXY_DETECTION_URL = "https://www.ipqualityscore.com/api/json/ip/{api_key}/{ip}"
 
+# Query parameters sent with every lookup; never mutated, so calls without a user agent share it
+_BASE_PARAMS = {
+    'strictness': 1,
+    'allow_public_access_points': 'true',
+    'fast': 'true',
+    'lighter_penalties': 'true'
+}
+
+
+@lru_cache(maxsize=64)
+def _key_url_prefix(api_key: str) -> str:
+    """Lookup URL up to the IP, formatted once per key"""
+    return IPQS_PROXY_DETECTION_URL.format(api_key=api_key, ip='')
+
+# Requests reserved per key in one statement; handed out locally so the database is written
+# once per lease rather than once per impression
+IPQS_KEY_LEASE_SIZE = 100
+# A lease is also renewed after this many seconds, so deactivated or newly added keys are picked up
+IPQS_KEY_LEASE_TTL = 30.0
+
+# Picks the least-used key with quota left and reserves up to a lease of requests on it;
+# SKIP LOCKED lets concurrent reservations take different keys instead of queueing on one row
+_LEASE_PICK = (
+    select(
+        IPQSApiKey.id,
+        func.least(bindparam('lease_size', type_=Integer), IPQSApiKey.request_limit - IPQSApiKey.usage_count).label('granted')
+    )
+    .where(IPQSApiKey.is_active == True, IPQSApiKey.usage_count < IPQSApiKey.request_limit)
+    .order_by(IPQSApiKey.usage_count.asc(), IPQSApiKey.last_used_at.asc().nullsfirst())
+    .limit(1)
+    .with_for_update(skip_locked=True)
+    .cte('pick')
+)
+_Q_LEASE_IPQS_KEY = (
+    update(IPQSApiKey)
+    .where(IPQSApiKey.id == _LEASE_PICK.c.id)
+    .values(usage_count=IPQSApiKey.usage_count + _LEASE_PICK.c.granted, last_used_at=func.now())
+    .returning(IPQSApiKey.id, IPQSApiKey.api_key, _LEASE_PICK.c.granted)
+)
+# Gives back the unused part of a lease
+_Q_RELEASE_IPQS_KEY = (
+    update(IPQSApiKey)
+    .where(IPQSApiKey.id == bindparam('key_id'))
+    .values(usage_count=func.greatest(IPQSApiKey.usage_count - bindparam('unused', type_=Integer), 0))
+)
+
+_lease = {'key_id': None, 'api_key': None, 'remaining': 0, 'expires': 0.0}
+_lease_lock = asyncio.Lock()
+
+# Shared session so lookups reuse pooled keep-alive connections and cached DNS for IPQS;
+# created lazily because aiohttp sessions must be built inside the running loop
+_session: Optional[aiohttp.ClientSession] = None
+_session_lock = asyncio.Lock()
+
+
+async def _get_session() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        async with _session_lock:
+            if _session is None or _session.closed:
+                _session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(limit=100, limit_per_host=64, ttl_dns_cache=300, keepalive_timeout=75),
+                    timeout=aiohttp.ClientTimeout(total=10)
+                )
+    return _session
+
+
+# Recent successful verifications keyed by (ip, user agent); failures are never cached
+IPQS_CACHE_TTL = 900.0
+IPQS_CACHE_MAX_ENTRIES = 50000
+_result_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+# Futures for lookups currently in flight, keyed like the result cache
+_inflight: Dict[tuple, asyncio.Future] = {}
+
+
+def _cache_get(key: tuple) -> Optional["IPQSResult"]:
+    entry = _result_cache.get(key)
+    if entry is None:
+        return None
+    result, expires = entry
+    if expires <= time.monotonic():
+        del _result_cache[key]
+        return None
+    _result_cache.move_to_end(key)
+    return result
+
+
+def _cache_put(key: tuple, result: "IPQSResult", ttl: float):
+    _result_cache[key] = (replace(result, cached=True), time.monotonic() + ttl)
+    _result_cache.move_to_end(key)
+    while len(_result_cache) > IPQS_CACHE_MAX_ENTRIES:
+        _result_cache.popitem(last=False)
+
+
+_LOCAL_IP_STRINGS = frozenset({'127.0.0.1', 'localhost', '0.0.0.0', '::1'})
+
+
+@lru_cache(maxsize=4096)
+def _is_internal_ip(ip_address: str) -> bool:
+    """True for loopback, private, link-local and multicast addresses, which IPQS cannot score"""
+    if ip_address in _LOCAL_IP_STRINGS:
+        return True
+    try:
+        ip_obj = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return False
+    return ip_obj.is_private or ip_obj.is_loopback or ip_obj.is_link_local or ip_obj.is_multicast
+
+
+def get_cached_ip_quality(ip_address: str, user_agent: Optional[str] = None) -> Optional["IPQSResult"]:
+    """
+    Return a verdict that needs no IPQS request (internal IP or still-fresh cached result),
+    so callers can skip reserving a key
+    """
+    if _is_internal_ip(ip_address):
+        return IPQSResult(success=True, fraud_score=0, message="Local IP, skipping verification")
+    return _cache_get((ip_address, user_agent or ""))
+
+
+async def close_ipqs_session():
+    """Close the shared IPQS HTTP session (call from after_serving)"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
 
 async def get_available_ipqs_key():
-    """Get an available IPQS API key from the database with usage tracking"""
-    from bot.database import AsyncSessionLocal
-    from bot.models import IPQSApiKey
-    from sqlalchemy import select
+    """
+    Take one request from the current IPQS key lease, leasing a new block when it runs out.
+    Returns (key_id, api_key), or (None, None) when every key is inactive or exhausted.
+    """
+    if _lease['remaining'] > 0 and time.monotonic() < _lease['expires']:
+        _lease['remaining'] -= 1
+        return _lease['key_id'], _lease['api_key']
     
-    async with AsyncSessionLocal() as db_session:
-        result = await db_session.execute(
-            select(IPQSApiKey)
-            .where(IPQSApiKey.is_active == True)
-            .order_by(IPQSApiKey.usage_count.asc(), IPQSApiKey.last_used_at.asc().nullsfirst())
-        )
-        keys = result.scalars().all()
+    async with _lease_lock:
+        if _lease['remaining'] == 0 or time.monotonic() >= _lease['expires']:
+            async with AsyncSessionLocal() as db_session:
+                async with db_session.begin():
+                    # Hand back what is left of an expired lease before taking a new one
+                    if _lease['key_id'] is not None and _lease['remaining'] > 0:
+                        await db_session.execute(
+                            _Q_RELEASE_IPQS_KEY,
+                            {'key_id': _lease['key_id'], 'unused': _lease['remaining']}
+                        )
+                    result = await db_session.execute(_Q_LEASE_IPQS_KEY, {'lease_size': IPQS_KEY_LEASE_SIZE})
+                    row = result.first()
+            if row is None:
+                _lease.update(key_id=None, api_key=None, remaining=0, expires=0.0)
+                return None, None
+            _lease.update(
+                key_id=row.id,
+                api_key=row.api_key,
+                remaining=row.granted,
+                expires=time.monotonic() + IPQS_KEY_LEASE_TTL
+            )
         
-        for key in keys:
-            if key.usage_count < key.request_limit:
-                return key.id, key.api_key
-        
-        return None, None
+        _lease['remaining'] -= 1
+        return _lease['key_id'], _lease['api_key']
 
 
-async def increment_ipqs_key_usage(key_id: int):
-    """Increment usage count for an IPQS API key"""
-    from bot.database import AsyncSessionLocal
-    from bot.models import IPQSApiKey
-    from sqlalchemy import select
-    
-    async with AsyncSessionLocal() as db_session:
-        result = await db_session.execute(
-            select(IPQSApiKey).where(IPQSApiKey.id == key_id)
-        )
-        key = result.scalar_one_or_none()
-        
-        if key:
-            key.usage_count += 1
-            key.last_used_at = datetime.now(timezone.utc)
-            await db_session.commit()
+async def return_ipqs_key_slot(key_id: int):
+    """
+    Give back one request taken by get_available_ipqs_key() that did not result in a
+    successful IPQS call of its own (shared in-flight result or failed request)
+    """
+    async with _lease_lock:
+        if _lease['key_id'] == key_id and time.monotonic() < _lease['expires']:
+            _lease['remaining'] += 1
+            return
+        # The lease has moved on since the slot was taken; credit the key directly
+        async with AsyncSessionLocal() as db_session:
+            async with db_session.begin():
+                await db_session.execute(_Q_RELEASE_IPQS_KEY, {'key_id': key_id, 'unused': 1})
+
+
+async def release_ipqs_lease():
+    """Return the unused part of the current lease to its key (call from after_serving)"""
+    async with _lease_lock:
+        if _lease['key_id'] is not None and _lease['remaining'] > 0:
+            async with AsyncSessionLocal() as db_session:
+                async with db_session.begin():
+                    await db_session.execute(
+                        _Q_RELEASE_IPQS_KEY,
+                        {'key_id': _lease['key_id'], 'unused': _lease['remaining']}
+                    )
+        _lease.update(key_id=None, api_key=None, remaining=0, expires=0.0)
 
-@dataclass
+
+@dataclass(slots=True, frozen=True)
 class IPQSResult:
     success: bool
     fraud_score: int = 0
@@ -63,94 +229,117 @@ class IPQSResult:
     isp: Optional[str] = None
     message: Optional[str] = None
     request_id: Optional[str] = None
+    # True when served from the local cache, i.e. no IPQS request (and no key usage) was made
+    cached: bool = False
+    
+    _rejection_reason: Optional[str] = field(init=False, repr=False, compare=False, default=None)
+    
+    def __post_init__(self):
+        # Results are immutable, so the verdict is computed once instead of on every property access
+        reason = (
+            "Bot detected" if self.is_bot
+            else "Crawler detected" if self.is_crawler
+            else "VPN detected" if self.is_vpn
+            else "Proxy detected" if self.is_proxy
+            else "Tor network detected" if self.is_tor
+            else f"High fraud score: {self.fraud_score}" if self.fraud_score >= 85
+            else "Recent abuse detected" if self.recent_abuse
+            else None
+        )
+        object.__setattr__(self, '_rejection_reason', reason)
     
     @property
     def is_valid_impression(self) -> bool:
-        if self.is_bot or self.is_crawler:
-            return False
-        if self.is_vpn:
-            return False
-        if self.is_proxy:
-            return False
-        if self.is_tor:
-            return False
-        if self.fraud_score >= 85:
-            return False
-        if self.recent_abuse:
-            return False
-        return True
+        return self._rejection_reason is None
     
     @property
     def rejection_reason(self) -> Optional[str]:
-        if self.is_bot:
-            return "Bot detected"
-        if self.is_crawler:
-            return "Crawler detected"
-        if self.is_vpn:
-            return "VPN detected"
-        if self.is_proxy:
-            return "Proxy detected"
-        if self.is_tor:
-            return "Tor network detected"
-        if self.fraud_score >= 85:
-            return f"High fraud score: {self.fraud_score}"
-        if self.recent_abuse:
-            return "Recent abuse detected"
-        return None
+        return self._rejection_reason
 
-
-async def verify_ip_quality(api_key: str, ip_address: str, user_agent: Optional[str] = None) -> IPQSResult:
+async def verify_ip_quality(api_key: str, ip_address: str, user_agent: Optional[str] = None, cache_ttl: Optional[float] = None) -> IPQSResult:
+    """
+    Check an IP with IPQS. Successful results are reused for cache_ttl seconds
+    (IPQS_CACHE_TTL by default); pass cache_ttl=0 to force a fresh lookup.
+    """
     if not api_key or not ip_address:
         return IPQSResult(success=False, message="API key or IP address missing")
     
-    if ip_address in ['127.0.0.1', 'localhost', '0.0.0.0']:
+    if _is_internal_ip(ip_address):
         return IPQSResult(success=True, fraud_score=0, message="Local IP, skipping verification")
     
-    url = IPQS_PROXY_DETECTION_URL.format(api_key=api_key, ip=ip_address)
+    if cache_ttl is None:
+        cache_ttl = IPQS_CACHE_TTL
+    cache_key = (ip_address, user_agent or "")
+    if cache_ttl > 0:
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            return cached
+    
+    # Concurrent lookups for the same key share one IPQS request
+    inflight = _inflight.get(cache_key)
+    if inflight is not None:
+        try:
+            result = await asyncio.shield(inflight)
+        except asyncio.CancelledError:
+            if not inflight.cancelled():
+                raise
+            # The request we were sharing was cancelled; make our own
+            return await verify_ip_quality(api_key, ip_address, user_agent, cache_ttl)
+        return replace(result, cached=True)
     
-    params = {
-        'strictness': 1,
-        'allow_public_access_points': 'true',
-        'fast': 'true',
-        'lighter_penalties': 'true'
-    }
+    inflight = asyncio.get_running_loop().create_future()
+    _inflight[cache_key] = inflight
+    try:
+        result = await _fetch_ip_quality(api_key, ip_address, user_agent)
+    except BaseException:
+        inflight.cancel()
+        raise
+    finally:
+        _inflight.pop(cache_key, None)
+    inflight.set_result(result)
     
-    if user_agent:
-        params['user_agent'] = user_agent
+    if result.success and cache_ttl > 0:
+        _cache_put(cache_key, result, cache_ttl)
+    return result
+
+
+async def _fetch_ip_quality(api_key: str, ip_address: str, user_agent: Optional[str]) -> IPQSResult:
+    url = _key_url_prefix(api_key) + ip_address
+    params = {**_BASE_PARAMS, 'user_agent': user_agent} if user_agent else _BASE_PARAMS
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                if response.status != 200:
-                    logger.error(f"IPQS API error: HTTP {response.status}")
-                    return IPQSResult(success=False, message=f"HTTP error: {response.status}")
-                
-                data = await response.json()
-                
-                if not data.get('success', False):
-                    error_msg = data.get('message', 'Unknown error')
-                    logger.error(f"IPQS API error: {error_msg}")
-                    return IPQSResult(success=False, message=error_msg)
-                
-                result = IPQSResult(
-                    success=True,
-                    fraud_score=data.get('fraud_score', 0),
-                    is_proxy=data.get('proxy', False),
-                    is_vpn=data.get('vpn', False),
-                    is_tor=data.get('tor', False),
-                    is_bot=data.get('bot_status', False),
-                    recent_abuse=data.get('recent_abuse', False),
-                    is_crawler=data.get('is_crawler', False),
-                    country_code=data.get('country_code'),
-                    city=data.get('city'),
-                    isp=data.get('ISP'),
-                    request_id=data.get('request_id')
-                )
-                
-                logger.info(f"IPQS verification for {ip_address}: fraud_score={result.fraud_score}, bot={result.is_bot}, vpn={result.is_vpn}, proxy={result.is_proxy}, valid={result.is_valid_impression}")
-                
-                return result
-                
+        session = await _get_session()
+        async with session.get(url, params=params) as response:
+            if response.status != 200:
+                logger.error(f"IPQS API error: HTTP {response.status}")
+                return IPQSResult(success=False, message=f"HTTP error: {response.status}")
+            
+            data = _json_loads(await response.read())
+            
+            if not data.get('success', False):
+                error_msg = data.get('message', 'Unknown error')
+                logger.error(f"IPQS API error: {error_msg}")
+                return IPQSResult(success=False, message=error_msg)
+            
+            result = IPQSResult(
+                success=True,
+                fraud_score=data.get('fraud_score', 0),
+                is_proxy=data.get('proxy', False),
+                is_vpn=data.get('vpn', False),
+                is_tor=data.get('tor', False),
+                is_bot=data.get('bot_status', False),
+                recent_abuse=data.get('recent_abuse', False),
+                is_crawler=data.get('is_crawler', False),
+                country_code=data.get('country_code'),
+                city=data.get('city'),
+                isp=data.get('ISP'),
+                request_id=data.get('request_id')
+            )
+            
+            logger.info(f"IPQS verification for {ip_address}: fraud_score={result.fraud_score}, bot={result.is_bot}, vpn={result.is_vpn}, proxy={result.is_proxy}, valid={result.is_valid_impression}")
+            
+            return result
+            
     except asyncio.TimeoutError:
         logger.error(f"IPQS API timeout for IP: {ip_address}")
         return IPQSResult(success=False, message="Request timeout")
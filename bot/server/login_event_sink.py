@@ -0,0 +1,115 @@
+"""Buffered COPY writer for publisher_login_events"""
+from bot.database import engine
+from bot.models import PublisherLoginEvent
+from datetime import datetime, timezone
+from logging import getLogger
+import asyncio
+
+logger = getLogger('bot')
+
+# Flush once this many events are buffered, or FLUSH_INTERVAL seconds after the first one arrives
+FLUSH_BATCH_SIZE = 200
+FLUSH_MAX_BATCH = 500
+FLUSH_INTERVAL = 1.0
+# Events beyond this are dropped (and logged) rather than growing memory without bound
+MAX_PENDING_EVENTS = 10000
+
+_COLUMNS = (
+    'publisher_id', 'email', 'success', 'failure_reason', 'ip_address', 'user_agent',
+    'country_code', 'country_name', 'device_fingerprint', 'hardware_fingerprint',
+    'device_type', 'device_name', 'operating_system', 'browser_name', 'browser_version',
+    'created_at',
+)
+
+# Column widths for the String columns; values are clamped so one oversized field cannot fail a whole COPY
+_MAX_LENGTHS = tuple(
+    getattr(PublisherLoginEvent.__table__.c[column].type, 'length', None) for column in _COLUMNS
+)
+
+_queue = asyncio.Queue(maxsize=MAX_PENDING_EVENTS)
+_drain_task = None
+
+def enqueue(fields: dict):
+    """Buffer a login event row; created_at is stamped now rather than at flush time"""
+    fields.setdefault('created_at', datetime.now(timezone.utc))
+    try:
+        _queue.put_nowait(tuple(
+            value[:max_length] if max_length and isinstance(value, str) else value
+            for value, max_length in zip((fields.get(column) for column in _COLUMNS), _MAX_LENGTHS)
+        ))
+    except asyncio.QueueFull:
+        logger.warning("Login event buffer full, dropping event")
+
+async def _copy_rows(rows: list):
+    try:
+        async with engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            try:
+                await raw.driver_connection.copy_records_to_table(
+                    'publisher_login_events', records=rows, columns=_COLUMNS
+                )
+            except Exception as e:
+                if len(rows) == 1:
+                    raise
+                # Retry one row at a time so a single bad row does not lose the rest of the batch
+                logger.warning(f"Login event batch of {len(rows)} failed ({str(e)}), retrying row by row")
+                for row in rows:
+                    try:
+                        await raw.driver_connection.copy_records_to_table(
+                            'publisher_login_events', records=[row], columns=_COLUMNS
+                        )
+                    except Exception as row_error:
+                        logger.error(f"Failed to write login event for {row[1]!r}: {str(row_error)}")
+    except Exception as e:
+        logger.error(f"Failed to write {len(rows)} login events: {str(e)}")
+
+async def _collect_batch(rows: list):
+    rows.append(await _queue.get())
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + FLUSH_INTERVAL
+    while len(rows) < FLUSH_BATCH_SIZE:
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            rows.append(await asyncio.wait_for(_queue.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+    while len(rows) < FLUSH_MAX_BATCH and not _queue.empty():
+        rows.append(_queue.get_nowait())
+
+async def _drain_forever():
+    rows = []
+    try:
+        while True:
+            await _collect_batch(rows)
+            batch, rows = rows, []
+            await _copy_rows(batch)
+    except asyncio.CancelledError:
+        # Rows already pulled off the queue when shutdown began still get written
+        if rows:
+            await _copy_rows(rows)
+        raise
+
+def start():
+    """Start the background drain task (call from before_serving)"""
+    global _drain_task
+    if _drain_task is None:
+        _drain_task = asyncio.create_task(_drain_forever())
+
+async def stop():
+    """Stop the drain task and flush whatever is still buffered (call before close_db)"""
+    global _drain_task
+    if _drain_task is not None:
+        _drain_task.cancel()
+        try:
+            await _drain_task
+        except asyncio.CancelledError:
+            pass
+        _drain_task = None
+
+    while not _queue.empty():
+        rows = []
+        while len(rows) < FLUSH_MAX_BATCH and not _queue.empty():
+            rows.append(_queue.get_nowait())
+        await _copy_rows(rows)
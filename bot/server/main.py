@@ -15,7 +15,7 @@ from secrets import token_hex
 from bot.server.security import csrf_protect, rate_limit, api_rate_limit
 from bot.server.api_auth import require_endpoint_api_key
 from bot.server.earning_service import process_premium_link_earning
-from bot.server.ipqs_service import verify_ip_quality, get_available_ipqs_key, increment_ipqs_key_usage
+from bot.server.ipqs_service import verify_ip_quality, get_available_ipqs_key, get_cached_ip_quality, return_ipqs_key_slot
 import httpx
 import logging
 import os
@@ -880,15 +880,20 @@ async def tracking_postback():
             settings = settings_result.scalar_one_or_none()
             
             if settings and settings.ipqs_enabled:
-                key_id, api_key = await get_available_ipqs_key()
+                user_agent = request.headers.get('User-Agent', '')
+                # A cached verdict needs no key, so check it before reserving quota on one
+                ipqs_result = get_cached_ip_quality(user_ip, user_agent)
                 
-                if api_key:
-                    user_agent = request.headers.get('User-Agent', '')
-                    ipqs_result = await verify_ip_quality(api_key, user_ip, user_agent)
-                    
+                if ipqs_result is None:
+                    key_id, api_key = await get_available_ipqs_key()
+                    if api_key:
+                        ipqs_result = await verify_ip_quality(api_key, user_ip, user_agent)
+                        # Only a successful request of our own counts against the key's quota
+                        if ipqs_result.cached or not ipqs_result.success:
+                            await return_ipqs_key_slot(key_id)
+                
+                if ipqs_result is not None:
                     if ipqs_result.success:
-                        await increment_ipqs_key_usage(key_id)
-                        
                         if not ipqs_result.is_valid_impression:
                             rejection_reason = ipqs_result.rejection_reason or "Invalid impression"
                             logger.info(f"IPQS rejected impression for IP {user_ip}: {rejection_reason}")
@@ -1,9 +1,10 @@
 from quart import Blueprint, request, render_template, session, jsonify
 from bot.database import AsyncSessionLocal
-from bot.models import WebPublisherSubscription, WebPublisherSubscriptionPlan, Publisher, Settings
+from bot.models import WebPublisherSubscription, WebPublisherSubscriptionPlan, Publisher
 from sqlalchemy import select, desc, and_, or_
 from .utils import require_publisher
 from bot.server.security import csrf_protect, get_csrf_token
+from bot.server.settings_cache import get_cached_settings
 from bot.server.payment_service import generate_order_id, create_payment_links, check_paytm_status, calculate_expiry_date
 from logging import getLogger
 from datetime import datetime
@@ -36,31 +37,27 @@ async def check_upload_allowed(publisher_id: int):
     Monthly-based subscription - unlimited uploads during active subscription period.
     Returns: (allowed: bool, subscription: WebPublisherSubscription or None, message: str)
     """
-    async with AsyncSessionLocal() as db_session:
-        settings_result = await db_session.execute(select(Settings))
-        settings = settings_result.scalar_one_or_none()
-        
-        if not settings or not settings.web_publisher_subscriptions_enabled:
-            return True, None, "Subscriptions not required"
-        
-        subscription = await get_active_web_subscription(publisher_id)
-        
-        if not subscription:
-            return False, None, "Active subscription required to upload videos"
-        
-        return True, subscription, "Upload allowed"
+    settings = await get_cached_settings()
+    
+    if not settings or not settings.web_publisher_subscriptions_enabled:
+        return True, None, "Subscriptions not required"
+    
+    subscription = await get_active_web_subscription(publisher_id)
+    
+    if not subscription:
+        return False, None, "Active subscription required to upload videos"
+    
+    return True, subscription, "Upload allowed"
 
 
 @bp.route('/subscription')
 @require_publisher
 async def subscription():
     """Display publisher subscription page"""
+    settings = await get_cached_settings()
+    web_subscriptions_enabled = settings.web_publisher_subscriptions_enabled if settings else False
+    
     async with AsyncSessionLocal() as db_session:
-        settings_result = await db_session.execute(select(Settings))
-        settings = settings_result.scalar_one_or_none()
-        
-        web_subscriptions_enabled = settings.web_publisher_subscriptions_enabled if settings else False
-        
         active_subscription = await get_active_web_subscription(session['publisher_id'])
         
         result = await db_session.execute(
@@ -114,8 +111,7 @@ async def create_payment():
     
     async with AsyncSessionLocal() as db_session:
         try:
-            settings_result = await db_session.execute(select(Settings))
-            settings = settings_result.scalar_one_or_none()
+            settings = await get_cached_settings()
             
             if not settings or not settings.web_publisher_subscriptions_enabled:
                 return jsonify({
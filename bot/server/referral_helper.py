@@ -187,20 +187,18 @@ async def process_withdrawal_milestone(publisher_id: int, withdrawal_id: int):
     """Process referral rewards when a publisher completes a withdrawal"""
     try:
         async with AsyncSessionLocal() as db_session:
-            settings_result = await db_session.execute(select(ReferralSettings))
-            settings = settings_result.scalar_one_or_none()
-            
-            if not settings or not settings.is_enabled:
-                return
-            
-            referral_result = await db_session.execute(
-                select(Referral).where(Referral.referred_publisher_id == publisher_id)
-            )
-            referral = referral_result.scalar_one_or_none()
-            
-            if not referral:
+            # Settings and referral in one round trip; no row means the program is off or the
+            # publisher was not referred, which is the common case for an approval
+            row = (await db_session.execute(
+                select(Referral, ReferralSettings)
+                .join(ReferralSettings, ReferralSettings.is_enabled == True)
+                .where(Referral.referred_publisher_id == publisher_id)
+            )).first()
+            
+            if not row:
                 return
             
+            referral, settings = row
             referral.completed_withdrawals += 1
             await db_session.commit()
             
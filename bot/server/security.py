@@ -1,5 +1,5 @@
 """Security utilities for CSRF protection, rate limiting, and input validation"""
-from quart import request, session, abort
+from quart import request, session, abort, g
 from functools import wraps
 from secrets import token_urlsafe
 from datetime import datetime, timedelta, timezone
@@ -9,6 +9,7 @@ from bot.models import RateLimit, Settings
 from sqlalchemy import select, delete
 import re
 import html
+import hmac
 from typing import Optional
 import ipaddress
 from urllib.parse import urlparse
@@ -22,20 +23,30 @@ def generate_csrf_token() -> str:
     """Generate a new CSRF token and store it in the session"""
     token = token_urlsafe(32)
     session['csrf_token'] = token
+    g.csrf_token = token
     return token
 
 def get_csrf_token() -> Optional[str]:
-    """Get the CSRF token from the session, create one if it doesn't exist"""
+    """
+    Get the CSRF token from the session, create one if it doesn't exist.
+    The token is memoized on ``g`` so repeated calls within a request reuse it.
+    """
+    token = g.get('csrf_token')
+    if token is not None:
+        return token
     if 'csrf_token' not in session:
         return generate_csrf_token()
-    return session.get('csrf_token')
+    token = session.get('csrf_token')
+    g.csrf_token = token
+    return token
 
 def validate_csrf_token(token: str) -> bool:
     """Validate a CSRF token against the session token"""
     session_token = session.get('csrf_token')
     if not session_token or not token:
         return False
-    return session_token == token
+    # Constant-time so the comparison does not leak how many leading characters matched
+    return hmac.compare_digest(session_token.encode('utf-8'), token.encode('utf-8'))
 
 def csrf_protect(func):
     """Decorator to protect routes from CSRF attacks"""
@@ -0,0 +1,38 @@
+"""In-process TTL cache for the singleton Settings row"""
+from bot.database import AsyncSessionLocal
+from bot.models import Settings
+from sqlalchemy import select
+from os import environ
+import time
+
+# Upper bound on how stale another process's view of Settings can get; invalidation is per process
+SETTINGS_CACHE_TTL = float(environ.get("SETTINGS_CACHE_TTL") or "30")
+
+_Q_SETTINGS = select(Settings)
+
+_settings_cache = {'value': None, 'expires': 0.0}
+
+async def get_cached_settings(db_session=None):
+    """
+    Return the Settings row, re-reading it from the database at most once per TTL.
+    Uses the given session on a cache miss, otherwise opens a short-lived one.
+    """
+    now = time.monotonic()
+    if now < _settings_cache['expires']:
+        return _settings_cache['value']
+    
+    if db_session is not None:
+        result = await db_session.execute(_Q_SETTINGS)
+        settings = result.scalar_one_or_none()
+    else:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(_Q_SETTINGS)
+            settings = result.scalar_one_or_none()
+    
+    _settings_cache['value'] = settings
+    _settings_cache['expires'] = now + SETTINGS_CACHE_TTL
+    return settings
+
+def invalidate_settings_cache():
+    """Force the next get_cached_settings() call to reload from the database"""
+    _settings_cache['expires'] = 0.0
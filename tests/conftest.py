@@ -0,0 +1,77 @@
+"""
+Shared fixtures for the query-budget tests.
+
+These run the real app against a disposable Postgres database named by TEST_DATABASE_URL;
+without it every test is skipped. The variable is copied into DATABASE_URL before bot is
+imported, because bot.database builds its engine at import time.
+"""
+from contextlib import contextmanager
+from os import environ
+import pytest
+
+TEST_DATABASE_URL = environ.get('TEST_DATABASE_URL')
+
+if TEST_DATABASE_URL:
+    environ['DATABASE_URL'] = TEST_DATABASE_URL
+    # Session cookies are Secure outside development, and the test client speaks plain http
+    environ['ENVIRONMENT'] = 'development'
+
+def pytest_collection_modifyitems(config, items):
+    if TEST_DATABASE_URL:
+        return
+    skip = pytest.mark.skip(reason='TEST_DATABASE_URL is not set')
+    for item in items:
+        item.add_marker(skip)
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+@contextmanager
+def _count_queries(engine):
+    from sqlalchemy import event
+    
+    queries = []
+    
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        queries.append(statement)
+    
+    event.listen(engine.sync_engine, 'before_cursor_execute', _record)
+    try:
+        yield queries
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', _record)
+
+@pytest.fixture
+def count_queries():
+    """
+    Context manager collecting every SQL statement the app engine sends while active:
+    
+        with count_queries() as queries:
+            await admin_client.get('/admin/referrals')
+        assert len(queries) <= 4
+    """
+    from bot.database import engine
+    return lambda: _count_queries(engine)
+
+@pytest.fixture
+async def admin_client():
+    """Test client with an admin session, on a freshly initialised schema"""
+    from bot.database import init_db, close_db, AsyncSessionLocal
+    from bot.models import Publisher
+    from bot.server import instance
+    from sqlalchemy import select
+    
+    await init_db()
+    async with AsyncSessionLocal() as db_session:
+        admin_id = await db_session.scalar(select(Publisher.id).where(Publisher.is_admin == True).limit(1))
+    
+    client = instance.test_client()
+    async with client.session_transaction() as session:
+        session['publisher_id'] = admin_id
+        session['is_admin'] = True
+    
+    try:
+        yield client
+    finally:
+        await close_db()
@@ -0,0 +1,84 @@
+"""Statement budgets for admin handlers whose N+1 loops were removed; a regression fails here"""
+from secrets import token_hex
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+async def _seed_referrals(count: int = 3):
+    from bot.database import AsyncSessionLocal
+    from bot.models import Publisher, Referral, ReferralReward
+    
+    async with AsyncSessionLocal() as db_session:
+        for _ in range(count):
+            referrer = Publisher(email=f'referrer_{token_hex(6)}@example.com', password_hash='x', traffic_source='test')
+            referred = Publisher(email=f'referred_{token_hex(6)}@example.com', password_hash='x', traffic_source='test')
+            db_session.add_all([referrer, referred])
+            await db_session.flush()
+            
+            referral = Referral(
+                referrer_id=referrer.id, referred_publisher_id=referred.id,
+                referral_code=token_hex(4), status='active'
+            )
+            db_session.add(referral)
+            await db_session.flush()
+            
+            db_session.add(ReferralReward(
+                referral_id=referral.id, referrer_id=referrer.id, referred_publisher_id=referred.id,
+                milestone_type='first_withdrawal', reward_amount=2.0, status='credited'
+            ))
+        await db_session.commit()
+
+async def _measure(client, count_queries, path: str) -> list:
+    # The first request fills the settings cache (and any lazily created rows), so only
+    # the handler's own statements are counted on the second
+    assert (await client.get(path)).status_code == 200
+    with count_queries() as queries:
+        response = await client.get(path)
+    assert response.status_code == 200
+    return queries
+
+async def test_referrals_query_budget(admin_client, count_queries):
+    await _seed_referrals()
+    queries = await _measure(admin_client, count_queries, '/admin/referrals')
+    assert len(queries) <= 4, queries
+
+async def test_referral_settings_query_budget(admin_client, count_queries):
+    await _seed_referrals(1)
+    queries = await _measure(admin_client, count_queries, '/admin/referral-settings')
+    assert len(queries) <= 2, queries
+
+async def _seed_withdrawal() -> int:
+    from bot.database import AsyncSessionLocal
+    from bot.models import Publisher, BankAccount, WithdrawalRequest
+    
+    async with AsyncSessionLocal() as db_session:
+        publisher = Publisher(email=f'payee_{token_hex(6)}@example.com', password_hash='x', traffic_source='test')
+        db_session.add(publisher)
+        await db_session.flush()
+        
+        bank_account = BankAccount(publisher_id=publisher.id, account_holder_name='Test')
+        db_session.add(bank_account)
+        await db_session.flush()
+        
+        withdrawal = WithdrawalRequest(publisher_id=publisher.id, bank_account_id=bank_account.id, amount=10.0)
+        db_session.add(withdrawal)
+        await db_session.commit()
+        return withdrawal.id
+
+async def test_withdrawals_query_budget(admin_client, count_queries):
+    await _seed_withdrawal()
+    queries = await _measure(admin_client, count_queries, '/admin/withdrawals')
+    assert len(queries) <= 2, queries
+
+async def test_approve_withdrawal_query_budget(admin_client, count_queries):
+    withdrawal_id = await _seed_withdrawal()
+    csrf_token = token_hex(16)
+    async with admin_client.session_transaction() as session:
+        session['csrf_token'] = csrf_token
+    
+    with count_queries() as queries:
+        response = await admin_client.post(
+            f'/admin/withdrawal/approve/{withdrawal_id}', form={'csrf_token': csrf_token}
+        )
+    assert response.status_code == 302
+    assert len(queries) <= 2, queries